@@ -8,6 +8,7 @@ class AntMan(FX):
     def setup(self):
         self.requires_mask = True # if your fx requires segmentation of objects
         self.requires_inpainting = True # if your fx requires inpainting of objects
+        self.frame_independent = False # the pyramid is only used once a sprite has been checked at normal size on an earlier frame
         self.requires_pose = False # if your fx requires pose estimation
 
         self.tiny_size = Vector(30, 30)
@@ -21,12 +22,107 @@ class AntMan(FX):
             spr.set_anchor_point_normalized(Vector(0.0, 0.9))
 
     def render_frame(self, frame_info: FrameInfo):
-        super().render_frame(frame_info)
+        # scaled cutouts are resampled from a pyramid here, anything else is left to the host
+        for sprite in self.sprite_manager.sprites:
+            if not self.render_scaled(frame_info, sprite):
+                sprite.render(frame_info)
         # new_tex = self.api.render_shader({
         #     "texSampler": frame_info.frame
         # })
         # ImageUtils.blend(frame_info.render_buffer, new_tex)
     
+    def get_pyramid(self, frame_info: FrameInfo, sprite, x1, y1, x2, y2):
+        # bgra cutout pyramid of the sprite for this frame, level 0 is the cutout at its source size, each level half the last
+        key = (frame_info.index, x1, y1, x2, y2)
+        if getattr(sprite, "pyramid_key", None) != key:
+            mask = sprite.mask[y1:y2, x1:x2]
+            mask = mask.view(np.uint8) if mask.dtype == bool else mask
+            cutout = cv2.merge((frame_info.frame[y1:y2, x1:x2], cv2.compare(mask, 0, cv2.CMP_GT)))
+            sprite.pyramid = [cutout]
+            sprite.pyramid_key = key
+        return sprite.pyramid
+
+    def get_level(self, pyramid, scale):
+        # the smallest level still bigger than the target, so what is left is a downscale of at most 2x, which bilinear still covers
+        level = 0
+        while scale * 2 ** (level + 1) < 1:
+            if level + 1 == len(pyramid):
+                top = pyramid[level]
+                if min(top.shape[:2]) < 2:
+                    break
+                # pyrDown blurs before it decimates, so heavy downscales do not alias
+                pyramid.append(cv2.pyrDown(top))
+            level += 1
+        return level
+
+    def render_scaled(self, frame_info: FrameInfo, sprite):
+        """
+        Renders a scaled cutout by resampling the nearest level of its pyramid, only over the part that lands
+        on the frame. Returns False if the sprite is not a scaled, axis aligned cutout, or its cutout has not been
+        verified against the host yet, and the host should render it.
+        """
+        if sprite.type != "cutout" or sprite.mask is None:
+            return False
+        # (blend mode the check was made with, whether the host agreed), checked again under another blend
+        verdict = getattr(sprite, "cutout_verdict", None)
+        verified = verdict[1] if verdict is not None and verdict[0] == sprite.blend_mode else None
+        if not sprite.is_transformed() and verified is not None:
+            return False
+        x1, y1, x2, y2 = [int(v) for v in sprite.bbox]
+        height, width = frame_info.render_buffer.shape[:2]
+        if x1 < 0 or y1 < 0 or x2 > width or y2 > height or x2 <= x1 or y2 <= y1:
+            return False
+
+        # anything rotated or flipped goes through the host
+        left, top = sprite.normalized_point_to_global(Vector(-1, -1))
+        right, bottom = sprite.normalized_point_to_global(Vector(1, 1))
+        right_top = sprite.normalized_point_to_global(Vector(1, -1))
+        if abs(right_top[0] - right) > 0.5 or abs(right_top[1] - top) > 0.5 or right <= left or bottom <= top:
+            return False
+        scale_x, scale_y = sprite.get_scale()
+        # placed like the host blits a sprite: resized to whole pixels and centered on a whole pixel
+        w, h = max(int((x2 - x1) * scale_x), 1), max(int((y2 - y1) * scale_y), 1)
+        center = sprite.normalized_point_to_global(Vector(0, 0))
+        ox, oy = int(center[0]) - w // 2, int(center[1]) - h // 2
+        if (w, h) == (x2 - x1, y2 - y1):
+            if verified is None:
+                return self.verify_cutout(frame_info, sprite, x1, y1, x2, y2, ox, oy)
+            return False
+        if not verified:
+            return False
+
+        # visible part of the destination rect
+        vx1, vy1 = max(ox, 0), max(oy, 0)
+        vx2, vy2 = min(ox + w, width), min(oy + h, height)
+        if vx2 <= vx1 or vy2 <= vy1:
+            return True
+
+        pyramid = self.get_pyramid(frame_info, sprite, x1, y1, x2, y2)
+        level = self.get_level(pyramid, max(scale_x, scale_y))
+        source = pyramid[level]
+        # visible window pixel -> level pixel, pixel centers line up like cv2.resize
+        ax = source.shape[1] / w
+        ay = source.shape[0] / h
+        affine = np.float32([
+            [ax, 0, (vx1 - ox + 0.5) * ax - 0.5],
+            [0, ay, (vy1 - oy + 0.5) * ay - 0.5],
+        ])
+        scaled = cv2.warpAffine(source, affine, (vx2 - vx1, vy2 - vy1), flags=cv2.INTER_LINEAR | cv2.WARP_INVERSE_MAP, borderMode=cv2.BORDER_REPLICATE)
+        ImageUtils.blend(frame_info.render_buffer, scaled, Vector(vx1, vy1), centered=False, blend_mode=sprite.blend_mode)
+        return True
+
+    def verify_cutout(self, frame_info: FrameInfo, sprite, x1, y1, x2, y2, x, y):
+        # the host renders the unscaled sprite, the pyramid is used for it once its base level blended at x, y matches
+        cutout = self.get_pyramid(frame_info, sprite, x1, y1, x2, y2)[0]
+        height, width = frame_info.render_buffer.shape[:2]
+        if x < 0 or y < 0 or x + x2 - x1 > width or y + y2 - y1 > height or not cv2.countNonZero(cutout[..., 3]):
+            return False
+        blended = frame_info.render_buffer.copy()
+        ImageUtils.blend(blended, cutout, Vector(x, y), centered=False, blend_mode=sprite.blend_mode)
+        sprite.render(frame_info)
+        sprite.cutout_verdict = (sprite.blend_mode, np.array_equal(blended, frame_info.render_buffer))
+        return True
+
     def get_custom_inspector(self):
         return [
             {
@@ -76,13 +172,22 @@ class AntMan(FX):
         self.update_existing_keyframes()
 
     def update_existing_keyframes(self):
+        # one pass over the keyframes, only the ones whose scale actually changes go back through set_scale
+        tiny_scale = self.tiny_size * 0.01
+        giant_scale = self.giant_size * 0.01
         for spr in self.sprite_manager.sprites:
             for keyframe in spr.keyframes:
-                scale_x, scale_y = keyframe.transform.get("scale", Vector(1.0, 1.0))
-                if scale_x < 1.0:
-                    spr.set_scale(self.tiny_size * 0.01, frame_index=keyframe.frame_index)
-                elif scale_x > 1.0:
-                    spr.set_scale(self.giant_size * 0.01, frame_index=keyframe.frame_index)
+                scale = keyframe.transform.get("scale", None)
+                if scale is None:
+                    continue
+                if scale[0] < 1.0:
+                    new_scale = tiny_scale
+                elif scale[0] > 1.0:
+                    new_scale = giant_scale
+                else:
+                    continue
+                if tuple(scale) != tuple(new_scale):
+                    spr.set_scale(new_scale, frame_index=keyframe.frame_index)
     
     def set_size(self, index, segment):
         if segment == "Tiny":
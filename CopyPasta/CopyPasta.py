@@ -7,6 +7,7 @@ class CopyPasta(FX):
     def setup(self):
         self.requires_mask = True # if your fx requires segmentation of objects
         self.requires_inpainting = False # if your fx requires inpainting of objects
+        self.frame_independent = True
 
     def get_custom_inspector(self):
         return [
@@ -39,5 +40,55 @@ class CopyPasta(FX):
         self.current_sprite().set_scale(Vector(scale/100, scale/100), local=True)
 
     def render_frame(self, frame_info: FrameInfo):
-        super().render_frame(frame_info)
-        
\ No newline at end of file
+        # a sprite and its clones blit one shared cutout, each with its own transform and blend mode
+        cutouts = {}
+        for sprite in self.sprite_manager.sprites:
+            cutout = self.get_shared_cutout(frame_info, sprite, cutouts)
+            verified = self.get_cutout_verdict(sprite)
+            if cutout is None or verified is False:
+                sprite.render(frame_info)
+            elif verified is None:
+                self.verify_cutout(frame_info, sprite, cutout)
+            else:
+                sprite.blit_sprite(frame_info, cutout, is_transformed=sprite.is_transformed())
+
+    def get_root(self, sprite):
+        # clones keep the parent of the sprite they were cloned from
+        return sprite.parent if sprite.parent is not None else sprite
+
+    def get_shared_cutout(self, frame_info: FrameInfo, sprite, cutouts):
+        # bgra cutout of the sprite's object, extracted once per frame for it and all of its clones.
+        # It is shared, so anything that needs to change its pixels has to copy it first
+        if sprite.type != "cutout" or sprite.mask is None:
+            return None
+        x1, y1, x2, y2 = [int(v) for v in sprite.bbox]
+        if x2 <= x1 or y2 <= y1:
+            return None
+        key = (id(self.get_root(sprite)), x1, y1, x2, y2)
+        cutout = cutouts.get(key)
+        if cutout is None:
+            mask = sprite.mask[y1:y2, x1:x2]
+            mask = mask.view(np.uint8) if mask.dtype == bool else mask
+            cutout = cutouts[key] = cv2.merge((frame_info.frame[y1:y2, x1:x2], cv2.compare(mask, 0, cv2.CMP_GT)))
+        return cutout
+
+    def get_cutout_verdict(self, sprite):
+        # whether blitting the cutout matched the host for the sprite as it is now, None if it has not been checked like this
+        verdict = getattr(sprite, "cutout_verdict", None)
+        inputs = (sprite.type, sprite.mask is not None, sprite.blend_mode)
+        return verdict[1] if verdict is not None and verdict[0] == inputs else None
+
+    def verify_cutout(self, frame_info: FrameInfo, sprite, cutout):
+        # the host renders the sprite, and the shared cutout is blitted from then on if it gives exactly the same pixels
+        if not cv2.countNonZero(cutout[..., 3]):
+            # nothing on screen to compare yet
+            sprite.render(frame_info)
+            return
+        blitted = frame_info.render_buffer.copy()
+        previous = frame_info.override_buffer
+        frame_info.override_buffer = blitted
+        sprite.blit_sprite(frame_info, cutout, is_transformed=sprite.is_transformed())
+        frame_info.override_buffer = previous
+        sprite.render(frame_info)
+        inputs = (sprite.type, sprite.mask is not None, sprite.blend_mode)
+        sprite.cutout_verdict = (inputs, np.array_equal(blitted, frame_info.render_buffer))
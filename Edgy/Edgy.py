@@ -8,24 +8,49 @@ class Edgy(FX):
     def setup(self):
         self.requires_mask = True # if your fx requires segmentation of objects
         self.requires_inpainting = True # if your fx requires inpainting of objects
+        self.frame_independent = True
+        self.mask_pack = None
+        # numpy channel feeding .r .g .b .a in the shader, textures are uploaded bgr(a) and read as rgb(a)
+        self.pack_channels = (2, 1, 0, 3)
 
+        # up to 4 sprites per pass, one per channel of u_blurredMasks, composited over each other in sprite order
         glow_shader = r"""
-        uniform sampler2D u_blurredMask;
-        uniform float u_glow_strength;
-        uniform vec3 u_glow_color;
+        uniform sampler2D u_blurredMasks;
+        uniform float u_glow_strength0;
+        uniform float u_glow_strength1;
+        uniform float u_glow_strength2;
+        uniform float u_glow_strength3;
+        uniform vec3 u_glow_color0;
+        uniform vec3 u_glow_color1;
+        uniform vec3 u_glow_color2;
+        uniform vec3 u_glow_color3;
+
+        vec4 over(vec4 acc, float blurredVal, vec3 color, float strength) {
+            vec3 bloom = clamp(color/(1.1-blurredVal) * blurredVal * strength * 0.1, 0.0, 1.0);
+            return vec4(acc.rgb * (1.0 - blurredVal) + bloom * blurredVal, acc.a * (1.0 - blurredVal) + blurredVal);
+        }
 
         void main() {
             vec2 uv = fragCoord.xy;
-            float blurredVal = texture(u_blurredMask, uv).r;
+            vec4 blurredVals = texture(u_blurredMasks, uv);
 
-            vec4 glowColor = vec4(u_glow_color/(1.1-blurredVal), 1.0);
-            vec4 bloom = glowColor * blurredVal * u_glow_strength * 0.1;
-            fragColor = bloom;
-            fragColor.a = blurredVal;
+            vec4 acc = vec4(0.0);
+            acc = over(acc, blurredVals.r, u_glow_color0, u_glow_strength0);
+            acc = over(acc, blurredVals.g, u_glow_color1, u_glow_strength1);
+            acc = over(acc, blurredVals.b, u_glow_color2, u_glow_strength2);
+            acc = over(acc, blurredVals.a, u_glow_color3, u_glow_strength3);
+            fragColor.rgb = acc.a > 0.0 ? acc.rgb / acc.a : vec3(0.0);
+            fragColor.a = acc.a;
         }
         """
 
-        self.api.set_fragment_shader(glow_shader)
+        # a host without a gl context can refuse the shader here or fail to render it later,
+        # either way render_shader_cpu shades the glows from then on
+        try:
+            self.api.set_fragment_shader(glow_shader)
+            self.use_shader = True
+        except Exception:
+            self.use_shader = False
 
 
     def on_ready(self):
@@ -78,16 +103,6 @@ class Edgy(FX):
             # }
         ]
     
-    def clear_buffer(self, sprite):
-        res = self.api.get_resolution()
-        sprite.buffer = np.zeros((res[1], res[0], 3), dtype=np.uint8)
-
-    def get_buffer(self, sprite):
-        if not hasattr(sprite, "buffer"):
-            self.clear_buffer(sprite)
-        return sprite.buffer
-        
-
     def combine_masks(self, mask1, mask2):
         # Step 1: Combine the masks
         combined_mask = cv2.bitwise_or(mask1[..., 0], mask2[..., 0])
@@ -115,52 +130,148 @@ class Edgy(FX):
 
         return gray
     
+    def get_glow(self, sprite, sigma):
+        """
+        Blurs the sprite's mask like cv2.GaussianBlur(mask, (0, 0), sigma), within 2 levels.
+
+        Only the bbox padded by 3 sigma is blurred, past that the glow is below one 8 bit step.
+        The single channel mask is taken down a pyramid until the blur left to do is a couple of
+        pixels, blurred there and brought back up, so large radii cost about as much as small ones.
+
+        Returns (glow, (x, y)) where glow is a uint8 roi whose top left is at x, y, or None.
+        """
+        height, width = sprite.mask.shape[:2]
+        pad = 3 * sigma
+        x1, y1, x2, y2 = [int(v) for v in sprite.bbox]
+        x1, y1 = max(x1 - pad, 0), max(y1 - pad, 0)
+        x2, y2 = min(x2 + pad, width), min(y2 + pad, height)
+        if x2 <= x1 or y2 <= y1:
+            return None
+
+        mask = sprite.mask[y1:y2, x1:x2]
+        if mask.dtype == bool:
+            mask = mask.view(np.uint8)
+        glow = cv2.compare(mask, 0, cv2.CMP_GT)
+
+        levels = max(int(np.log2(sigma / 2)), 0)
+        sizes = []
+        for _ in range(levels):
+            sizes.append((glow.shape[1], glow.shape[0]))
+            glow = cv2.pyrDown(glow)
+        # each pyrDown/pyrUp pair blurs with a variance of about 2 * 4^level, only the rest is left to do
+        remaining = max(sigma ** 2 - 2 * (4 ** levels - 1) / 3, 0.25) ** 0.5 / 2 ** levels
+        glow = cv2.GaussianBlur(glow, (0, 0), remaining)
+        for size in reversed(sizes):
+            glow = cv2.pyrUp(glow, dstsize=size)
+        return glow, (x1, y1)
+
+    def get_bloom_luts(self, color, strength):
+        """(bloom, premultiplied bloom) of the glow shader for every uint8 blurred value, as (1, 256, 3) luts in bgr order."""
+        blurred = np.arange(256, dtype=np.float32)[:, None] / 255
+        # colors reach the shader as 0-1 rgb, here they stay bgr
+        color = np.asarray(color, dtype=np.float32) / 255
+        bloom = np.clip(color / (1.1 - blurred) * blurred * (strength * 0.1), 0, 1)
+        return bloom[None], (bloom * blurred)[None]
+
+    def render_shader_cpu(self, uniforms):
+        """Same as the glow shader with the frame in bgr order, only shades the rect where a glow is above 0."""
+        pack = uniforms["u_blurredMasks"]
+        out = np.zeros(pack.shape[:2] + (4,), dtype=np.uint8)
+        layers = []
+        x1, y1, x2, y2 = pack.shape[1], pack.shape[0], 0, 0
+        for i, channel in enumerate(self.pack_channels):
+            blurred = cv2.extractChannel(pack, channel)
+            x, y, w, h = cv2.boundingRect(blurred)
+            if w == 0 or h == 0:
+                continue
+            layers.append((i, blurred[y:y+h, x:x+w], (x, y, w, h)))
+            x1, y1, x2, y2 = min(x1, x), min(y1, y), max(x2, x + w), max(y2, y + h)
+        if not layers:
+            return out
+
+        roi = out[y1:y2, x1:x2]
+        if len(layers) == 1:
+            # a lone glow is its own alpha and the bloom comes straight out of a lut
+            i, blurred, _ = layers[0]
+            bloom, _ = self.get_bloom_luts(uniforms[f"u_glow_color{i}"], uniforms[f"u_glow_strength{i}"])
+            roi[..., :3] = cv2.LUT(cv2.merge((blurred, blurred, blurred)), (bloom * 255 + 0.5).astype(np.uint8))
+            roi[..., 3] = blurred
+            return out
+
+        # outside of its own rect a layer leaves acc as is, so each one only touches its rect
+        values = np.arange(256, dtype=np.float32)[None, :, None] / 255
+        acc = np.zeros((y2 - y1, x2 - x1, 4), dtype=np.float32)
+        for i, blurred, (x, y, w, h) in layers:
+            blurred = cv2.merge((blurred, blurred, blurred, blurred))
+            _, premultiplied = self.get_bloom_luts(uniforms[f"u_glow_color{i}"], uniforms[f"u_glow_strength{i}"])
+            # acc * (1 - blurred) + premultiplied bloom, with the alpha riding along in the 4th channel
+            layer_acc = acc[y-y1:y-y1+h, x-x1:x-x1+w]
+            cv2.multiply(layer_acc, cv2.LUT(blurred, 1 - values), dst=layer_acc)
+            cv2.add(layer_acc, cv2.LUT(blurred, np.dstack((premultiplied, values))), dst=layer_acc)
+
+        # un-premultiply, same as fragColor.rgb = acc.rgb / acc.a, cv2.divide gives 0 where acc.a is 0
+        b, g, r, alpha = cv2.split(acc)
+        color = cv2.divide(cv2.merge((b, g, r)), cv2.merge((alpha, alpha, alpha)))
+        roi[..., :3] = cv2.convertScaleAbs(color, alpha=255)
+        roi[..., 3] = cv2.convertScaleAbs(alpha, alpha=255)
+        return out
+
+    def render_glows(self, frame_info: FrameInfo, glows):
+        # packs up to 4 sprite glows into the channels of one texture so they shade, read back and blend in one go
+        res = self.api.get_resolution()
+        if self.mask_pack is None or self.mask_pack.shape[:2] != (res[1], res[0]):
+            self.mask_pack = np.zeros((res[1], res[0], 4), dtype=np.uint8)
+        else:
+            self.mask_pack[:] = 0
+
+        uniforms = {"u_blurredMasks": self.mask_pack}
+        for i, channel in enumerate(self.pack_channels):
+            if i < len(glows):
+                glow, glow_strength, glow_color = glows[i]
+                if glow is not None:
+                    blurred_mask, (x, y) = glow
+                    h, w = blurred_mask.shape
+                    self.mask_pack[y:y+h, x:x+w, channel] = blurred_mask
+            else:
+                glow_strength, glow_color = 0, (0, 0, 0)
+            uniforms[f"u_glow_strength{i}"] = glow_strength
+            uniforms[f"u_glow_color{i}"] = glow_color #important to have "color" in the name so it knows to convert from bgr to rgb
+
+        new_buffer = None
+        if self.use_shader:
+            try:
+                new_buffer = self.api.render_shader(uniforms)
+            except Exception:
+                new_buffer = None
+            self.use_shader = new_buffer is not None
+        if new_buffer is None:
+            new_buffer = self.render_shader_cpu(uniforms)
+        ImageUtils.blend(frame_info.render_buffer, new_buffer, blend_mode="normal")
+
     def render_frame(self, frame_info: FrameInfo):
         
         
 
-        original_frame = frame_info.frame.copy()
+        glows = []
         for sprite in self.sprite_manager.sprites:
             if sprite.mask is None:
                 continue
-            
-            buffer = self.get_buffer(sprite)
-
-            if frame_info.index == 0:
-                self.clear_buffer(sprite)
-            else:
-                fade_factor = self.get_meta("trail_length", 50) / 100
-                buffer = (buffer * fade_factor).astype(np.uint8)
 
             glow_strength = sprite.get_meta("glow_strength", 50)
             glow_color = sprite.get_meta("glow_color", (100, 255, 50))
             
             blur_radius = sprite.get_meta("blur_radius", 50)
             
-            mask = sprite.get_mask_image()
-
             # if frame_info.index > 0:
             #     prev_frame = frame_info.index - 1
             #     prev_mask = self.api.get_mask_image(prev_frame, sprite.object_info.id)
             #     if prev_mask is not None:
             #         mask = self.combine_masks(mask, prev_mask)
             
-            blurred_mask = cv2.GaussianBlur(mask, (0, 0), int(blur_radius/4)+1)
-            
+            glows.append((self.get_glow(sprite, int(blur_radius/4)+1), glow_strength, glow_color))
 
-            ImageUtils.blend(buffer, blurred_mask, blend_mode="add")
-
-            uniforms = {
-                "u_blurredMask": buffer,
-                "u_glow_strength": glow_strength, 
-                "u_glow_color": glow_color #important to have "color" in the name so it knows to convert from bgr to rgb
-            }
-            new_buffer = self.api.render_shader(uniforms)
-
-
-            ImageUtils.blend(frame_info.render_buffer, new_buffer, blend_mode="normal")
-                
-        
+        for start in range(0, len(glows), 4):
+            self.render_glows(frame_info, glows[start:start + 4])
 
         #frame_info.frame = original_frame
         for sprite in self.sprite_manager.sprites:
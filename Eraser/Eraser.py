@@ -6,11 +6,14 @@ class Eraser(FX):
     def setup(self):
         self.requires_mask = True # if your fx requires segmentation of objects
         self.requires_inpainting = True # if your fx requires inpainting of objects
+        self.frame_independent = True
+
+    # the inpainted frame is fetched once, as the background, and is the whole output
+    def render_background(self, frame_info: FrameInfo):
+        frame_info.render_buffer = self.api.get_inpainting(frame_info)
 
     def render_frame(self, frame_info: FrameInfo):
-        frame = self.api.get_inpainting(frame_info)
-        return frame 
-    
+        return frame_info.render_buffer
     
     # override and do not add default sprites
     def on_ready(self):
@@ -1,3 +1,4 @@
+import os
 import numpy as np
 import cv2
 from fx_api.fx import FX, FrameInfo
@@ -7,19 +8,64 @@ from fx_api.utils.image import ImageUtils
 
 
 from math import comb  # Available in Python 3.8+
+from collections import OrderedDict
 
 class GoGoGadget(FX):
     def setup(self):
         self.requires_pose = True
         self.requires_mask = True # if your fx requires segmentation of objects
         self.requires_inpainting = True # if your fx requires inpainting of objects
+        self.frame_independent = True
         self.requires_sprites = True # if your fx requires sprites to manipulate objects
         self.default_link_size = 50
+        self.link_angle_bins = 360 # rotations of the link are quantized to this many angles
+        self.link_cache = OrderedDict() # link_size -> scaled link image and the rotations built for it so far
+        self.link_cache_size = 4
+        self.link_cache_bytes = 64 * 1024 * 1024 # bound on the built rotations of every cached size together
+        self.link_mtime = None
 
     def on_ready(self):
         super().on_ready()
 
+        self.load_link()
+        self.get_link(self.default_link_size)
+
+    def load_link(self):
+        # (re)loads link.png and drops every scaled link and rotation made from the old one
         self.link_original = self.get_image_resource("link.png") 
+        self.link_mtime = self.get_link_mtime()
+        self.link_cache.clear()
+
+    def get_link_mtime(self):
+        try:
+            return os.path.getmtime(os.path.join(os.path.dirname(os.path.abspath(__file__)), "link.png"))
+        except OSError:
+            return None
+
+    def get_link(self, link_size):
+        """
+        Returns the cache entry for link.png scaled to link_size percent, building it on first use.
+
+        The entry holds the scaled image and its rotation atlas (see get_rotated_links), so neither
+        is redone while the size stays the same.
+        """
+        entry = self.link_cache.get(link_size)
+        if entry is not None:
+            self.link_cache.move_to_end(link_size)
+            return entry
+
+        lh,lw = self.link_original.shape[:2]
+        scaled_size = Vector(lw,lh) * (link_size / 100)
+        image = cv2.resize(self.link_original, scaled_size.round(), interpolation=cv2.INTER_AREA)
+        entry = {
+            "image": image,
+            "rotations": {}, # angle bin -> (premultiplied link, 255 - alpha)
+            "bytes": 0,
+        }
+        self.link_cache[link_size] = entry
+        if len(self.link_cache) > self.link_cache_size:
+            self.link_cache.popitem(last=False)
+        return entry
 
     def bezier_curve_fit(self,image, points, num_points=100, color=(0, 255, 0), thickness=2):
         """
@@ -46,40 +92,83 @@ class GoGoGadget(FX):
             curve = np.zeros((num_points, 2))
             for i in range(n + 1):
                 curve += np.outer(bernstein_poly(i, n, t_values), control_points[i])
-            return curve.astype(int)
+            return curve
+
+        def resample_uniform(curve, num_points):
+            """Resample a dense polyline to num_points spaced evenly along its length."""
+            lengths = np.concatenate(([0], np.cumsum(np.linalg.norm(np.diff(curve, axis=0), axis=1))))
+            targets = np.linspace(0, lengths[-1], num_points)
+            return np.stack((np.interp(targets, lengths, curve[:, 0]), np.interp(targets, lengths, curve[:, 1])), axis=1)
 
         # Ensure points are a NumPy array
         points = np.array(points)
         
-        # Generate Bézier curve
-        bezier_points = bezier_curve(points, num_points)
-
-        # Draw the Bézier curve on the image
-        for i in range(1, len(bezier_points)):
-            p1 = tuple(bezier_points[i - 1])
-            p2 = tuple(bezier_points[i])
-            #cv2.line(image, p1, p2, color, thickness)
-
-            link = self.link_img.copy()
-            # Calculate angle between p1 and p2
-            angle = -(np.degrees(np.arctan2(p2[1] - p1[1], p2[0] - p1[0])) - 90)
-            
-            # Create rotation matrix
-            M = cv2.getRotationMatrix2D((link.shape[1]//2, link.shape[0]//2), angle, 1.0)
-            
-            # Rotate the link image
-            rotated_link = cv2.warpAffine(link, M, (link.shape[1], link.shape[0]))
-            
-            # Draw the rotated link at p1
-            x = p1[0] - rotated_link.shape[1]//2
-            y = p1[1] - rotated_link.shape[0]//2
-            
-
-            ImageUtils.blend(image, rotated_link, Vector(x,y))
-        
+        # Generate Bézier curve, evenly spaced by arc length so links don't bunch up where the curve is slow
+        bezier_points = resample_uniform(bezier_curve(points, max(num_points * 4, 2)), num_points).astype(int)
+
+        # Draw the links along the curve, each one rotated to follow the curve at its start point
+        if len(bezier_points) < 2:
+            return image
+
+        h, w = self.link_img.shape[:2]
+        starts = bezier_points[:-1]
+        deltas = bezier_points[1:] - starts
+        angles = -(np.degrees(np.arctan2(deltas[:, 1], deltas[:, 0])) - 90)
+        bins = np.round(angles * self.link_angle_bins / 360).astype(int) % self.link_angle_bins
+        rotations = self.get_rotated_links(bins)
+
+        # stack the links back to front onto one premultiplied canvas around the chain, then blend that once
+        corners = starts - (w // 2, h // 2)
+        x0, y0 = corners.min(axis=0)
+        x1, y1 = corners.max(axis=0) + (w, h)
+        canvas = np.zeros((y1 - y0, x1 - x0, 4), dtype=np.uint8)
+        for (x, y), b in zip(corners - (x0, y0), bins):
+            dst = canvas[y:y + h, x:x + w]
+            premultiplied, inverse_alpha = rotations[b]
+            cv2.multiply(dst, inverse_alpha, dst=dst, scale=1 / 255)
+            cv2.add(dst, premultiplied, dst=dst)
+
+        alpha = canvas[..., 3:].astype(np.float32)
+        color = np.divide(canvas[..., :3] * np.float32(255), alpha, out=np.zeros(canvas.shape[:2] + (3,), dtype=np.float32), where=alpha > 0)
+        canvas[..., :3] = np.clip(color + 0.5, 0, 255)
+        ImageUtils.blend(image, canvas, Vector(x0, y0))
         
         return image
 
+    def get_rotated_links(self, bins):
+        """
+        Returns the rotations of the current link, angle bin -> (rotated link premultiplied by its alpha,
+        255 - alpha in all four channels), which is all a back to front "over" needs.
+
+        Only the bins a chain actually uses get warped. Once the rotations of every cached size add up
+        to more than link_cache_bytes the least recently used sizes are dropped, and if the current
+        size alone is over, the bins this chain does not use.
+        """
+        rotations = self.link_entry["rotations"]
+
+        h, w = self.link_img.shape[:2]
+        for b in np.unique(bins):
+            if b in rotations:
+                continue
+            M = cv2.getRotationMatrix2D((w//2, h//2), b * 360 / self.link_angle_bins, 1.0)
+            rotated = cv2.warpAffine(self.link_img, M, (w, h))
+            alpha = rotated[..., 3:]
+            premultiplied = (rotated * (alpha / 255) + 0.5).astype(np.uint8)
+            premultiplied[..., 3:] = alpha
+            rotations[b] = (premultiplied, np.repeat(255 - alpha, 4, axis=2))
+            self.link_entry["bytes"] += premultiplied.nbytes * 2
+
+        while sum(entry["bytes"] for entry in self.link_cache.values()) > self.link_cache_bytes:
+            oldest = next(iter(self.link_cache.values()))
+            if oldest is self.link_entry:
+                used = set(np.unique(bins).tolist())
+                for b in [b for b in rotations if b not in used]:
+                    del rotations[b]
+                self.link_entry["bytes"] = sum(a.nbytes + i.nbytes for a, i in rotations.values())
+                break
+            self.link_cache.popitem(last=False)
+        return rotations
+
     def render_links(self, frame_info: FrameInfo, sprite):
         # Get current transform for this sprite
         transform = sprite.local_transform.copy()
@@ -109,12 +198,9 @@ class GoGoGadget(FX):
         thickness = 4
 
 
-        self.link_img = self.link_original.copy()
-        lh,lw = self.link_img.shape[:2]
-        # Scale link_img to match sprite scale
-        scaled_size = Vector(lw,lh) * (scale / 100)
-
-        self.link_img = cv2.resize(self.link_img, scaled_size.round(), interpolation=cv2.INTER_AREA)
+        # link_img scaled to match sprite scale, cached per size
+        self.link_entry = self.get_link(scale)
+        self.link_img = self.link_entry["image"]
         #for i in range(-10,10):
         i = 0
         wa = (parent_anchor[0] + i * thickness, parent_anchor[1])
@@ -158,6 +244,10 @@ class GoGoGadget(FX):
         ]
 
     def render_frame(self, frame_info: FrameInfo):
+        # link.png is reloaded if it changed on disk, checked once per frame rather than per sprite
+        if self.get_link_mtime() != self.link_mtime:
+            self.load_link()
+
         # Get all sprites from sprite manager
         for sprite in self.sprite_manager.sprites:
             if sprite.get_meta("enable_links", True):
@@ -1,3 +1,4 @@
+from collections import OrderedDict
 import numpy as np
 import cv2
 from fx_api.fx import FX, FrameInfo
@@ -8,6 +9,13 @@ class Inflate(FX):
     def setup(self):
         self.requires_mask = True # if your fx requires segmentation of objects
         self.requires_inpainting = True # if your fx requires inpainting of objects
+        self.frame_independent = True
+        self.cpu_warp = False # warp on the cpu with cv2.remap instead of the shader, set once the host can not run the shader
+        self.shader_full_frame = False # upload the whole frame, set once the host renders at frame size whatever it is given
+        self.warp_cache = OrderedDict() # (quantized bbox size, center phase, strength, frame size) -> remap grids, least recently used first
+        self.warp_cache_bytes = 128 * 1024 * 1024 # bound on the grids of every cached key together, one 4k grid at full strength is about 50 MB
+        self.warp_cache_used = 0
+        self.warp_size_step = 4 # bbox sizes are rounded to this many pixels so a tracked object reuses its grids
 
         # a simple shader to convert the image to grayscale
         inflate_shader = r"""
@@ -20,6 +28,8 @@ uniform sampler2D maskSampler;
 uniform vec2 maskCenter;
 uniform vec2 maskSize;
 uniform float inflate_size;
+uniform vec2 roiSize; // size in pixels of the frame region uploaded and rendered
+uniform vec2 frameSize; // the warp is computed in whole frame units so it keeps its shape whatever the roi
 
 vec2 inflate(vec2 uv, vec2 center, float radius, float strength) {
     float dist = distance(uv , center);
@@ -31,11 +41,12 @@ vec2 inflate(vec2 uv, vec2 center, float radius, float strength) {
 
 void main()
 {
-    vec2 uv = fragCoord;
+    vec2 uv = fragCoord * roiSize / frameSize;
     
-    vec2 pos = maskCenter / iResolution.xy;
-    float radius = length(maskSize/iResolution.xy) * 0.5;
+    vec2 pos = maskCenter / frameSize;
+    float radius = length(maskSize/frameSize) * 0.5;
     uv = inflate(uv, pos, radius, inflate_size);
+    uv = uv * frameSize / roiSize;
     vec3 color = texture(texSampler, uv).rgb;
     float alpha = texture(maskSampler, uv).r;
     fragColor.rgb = color;
@@ -43,7 +54,11 @@ void main()
 }
         """
 
-        self.api.set_fragment_shader(inflate_shader)
+        # headless render nodes have no gl context and may refuse the shader outright
+        try:
+            self.api.set_fragment_shader(inflate_shader)
+        except Exception:
+            self.cpu_warp = True
    
 
     # called when the fx is ready
@@ -62,37 +77,30 @@ void main()
             if sprite.mask is None:
                 continue
 
-            mask = sprite.get_mask_image()
-
             mask_bbox = sprite.bbox
             bbox_center = Vector((mask_bbox[0] + mask_bbox[2]) / 2, (mask_bbox[1] + mask_bbox[3]) / 2)
             bbox_size = Vector(mask_bbox[2] - mask_bbox[0], mask_bbox[3] - mask_bbox[1])
 
             inflate_size = sprite.get_meta("inflate_size", 0)/100
             if inflate_size > 0:
-                new_tex = self.api.render_shader({
-                    "texSampler": frame_info.frame,
-                    "maskSampler": mask,
-                    "maskCenter": bbox_center,
-                    "maskSize": bbox_size,
-                    "inflate_size": inflate_size,
-                })
-                # alpha blends the shader onto the frame
-                #bgr_image = new_tex[:, :, :3]  # Extract BGR channels
-                #alpha_image = new_tex[:, :, 3]  # Extract Alpha channel
+                # only the bbox grown by the inflation is uploaded and shaded, the warp never samples outside it
                 half_size = bbox_size/2
                 expansion = (half_size * inflate_size * 1.0)
                 x1, y1 = (bbox_center - half_size - expansion).round()
                 x2, y2 = (bbox_center + half_size + expansion).round()
-                #sprite.bbox = [x1, y1, x2, y2]
-                # Crop the new texture using the sprite's bounding box
-           
-                height, width = new_tex.shape[:2]
+                height, width = frame_info.frame.shape[:2]
                 x1 = max(0, x1)
                 y1 = max(0, y1)
                 x2 = min(width, x2)
                 y2 = min(height, y2)
-                new_tex_cropped = new_tex[y1:y2, x1:x2]
+                if x2 <= x1 or y2 <= y1:
+                    continue
+
+                new_tex_cropped = None if self.cpu_warp else self.render_warp_roi(frame_info, sprite, bbox_center, bbox_size, inflate_size, (x1, y1, x2, y2))
+                if new_tex_cropped is None:
+                    mask = sprite.mask[y1:y2, x1:x2]
+                    mask = cv2.compare(mask.view(np.uint8) if mask.dtype == bool else mask, 0, cv2.CMP_GT)
+                    new_tex_cropped = self.warp_cpu(frame_info.frame[y1:y2, x1:x2], mask, bbox_center, bbox_size, inflate_size, (x1, y1), (width, height))
                 new_size = (bbox_size * (inflate_size + 1)).round()
                 half_new_size = new_size/2
                 #sprite.bbox = [bbox_center.x - half_new_size.x, bbox_center.y - half_new_size.y, bbox_center.x + half_new_size.x, bbox_center.y + half_new_size.y]
@@ -105,6 +113,96 @@ void main()
                 #ImageUtils.blend(frame_info.render_buffer, new_tex, position=Vector(0,0), centered=False, blend_mode="normal")
             else:
                 sprite.render(frame_info)
+
+    def render_warp_roi(self, frame_info: FrameInfo, sprite, bbox_center, bbox_size, inflate_size, roi):
+        # the shader's warp of the roi, or None if the host can not render it. Hosts that render at frame size
+        # whatever they are given get the whole frame from then on, and the result is cropped, as it used to be
+        x1, y1, x2, y2 = roi
+        height, width = frame_info.frame.shape[:2]
+        while True:
+            ux1, uy1, ux2, uy2 = (0, 0, width, height) if self.shader_full_frame else roi
+            # single channel 0/255 mask, the shader only reads .r
+            mask = sprite.mask[uy1:uy2, ux1:ux2]
+            mask = mask.view(np.uint8) if mask.dtype == bool else mask
+            texture = self.render_warp_shader({
+                "texSampler": np.ascontiguousarray(frame_info.frame[uy1:uy2, ux1:ux2]),
+                "maskSampler": cv2.compare(mask, 0, cv2.CMP_GT),
+                "maskCenter": bbox_center - Vector(ux1, uy1),
+                "maskSize": bbox_size,
+                "inflate_size": inflate_size,
+                "roiSize": Vector(ux2 - ux1, uy2 - uy1),
+                "frameSize": Vector(width, height),
+            })
+            if texture is None:
+                return None
+            if texture.shape[:2] == (uy2 - uy1, ux2 - ux1):
+                return texture[y1 - uy1:y2 - uy1, x1 - ux1:x2 - ux1]
+            if self.shader_full_frame or texture.shape[:2] != (height, width):
+                # a viewport this can not place, stretched back over what was uploaded
+                texture = cv2.resize(texture, (ux2 - ux1, uy2 - uy1), interpolation=cv2.INTER_LINEAR)
+                return texture[y1 - uy1:y2 - uy1, x1 - ux1:x2 - ux1]
+            self.shader_full_frame = True
+
+    def render_warp_shader(self, uniforms):
+        # the shader's texture, or None once the host turns out not to be able to render it (no gl context)
+        try:
+            texture = self.api.render_shader(uniforms)
+        except Exception:
+            texture = None
+        self.cpu_warp = texture is None
+        return texture
+
+    def get_warp_grid(self, bbox_center, bbox_size, inflate_size, frame_size):
+        """Returns (map1, map2, extent) remap grids of the inflate() warp around a center at (extent, extent) + the center's half pixel phase."""
+        step = self.warp_size_step
+        size = (max(int(round(bbox_size.x / step)) * step, step), max(int(round(bbox_size.y / step)) * step, step))
+        phase = (float(bbox_center.x % 1), float(bbox_center.y % 1))
+        strength = round(inflate_size, 2)
+        key = (size, phase, strength, tuple(frame_size))
+        grid = self.warp_cache.get(key)
+        if grid is not None:
+            self.warp_cache.move_to_end(key)
+            return grid
+
+        # big enough to hold the inflated bbox of any size that rounds to this one
+        extent = int(np.ceil((max(size) / 2 + step) * (1 + strength))) + 2
+        width, height = frame_size
+        # same math as the shader: distances are measured in frame uv so the falloff follows the frame's aspect
+        offset_x = (np.arange(2 * extent, dtype=np.float32) + 0.5 - extent - phase[0])[None, :]
+        offset_y = (np.arange(2 * extent, dtype=np.float32) + 0.5 - extent - phase[1])[:, None]
+        radius = np.hypot(size[0] / width, size[1] / height) * 0.5
+        t = np.clip(np.hypot(offset_x / width, offset_y / height) / radius, 0, 1)
+        scale = 1 - strength + strength * (t * t * (3 - 2 * t))
+        # texture() samples at pixel centers, remap at pixel indices
+        map_x = (extent + phase[0] - 0.5 + offset_x * scale).astype(np.float32)
+        map_y = (extent + phase[1] - 0.5 + offset_y * scale).astype(np.float32)
+        map1, map2 = cv2.convertMaps(map_x, map_y, cv2.CV_16SC2)
+
+        grid = (map1, map2, extent)
+        self.warp_cache[key] = grid
+        self.warp_cache_used += map1.nbytes + map2.nbytes
+        # the grid just built always stays, even if it is bigger than the whole budget
+        while self.warp_cache_used > self.warp_cache_bytes and len(self.warp_cache) > 1:
+            old_map1, old_map2, _ = self.warp_cache.popitem(last=False)[1]
+            self.warp_cache_used -= old_map1.nbytes + old_map2.nbytes
+        return grid
+
+    def warp_cpu(self, frame_crop, mask_crop, bbox_center, bbox_size, inflate_size, origin, frame_size):
+        """CPU version of the inflate shader over a cropped roi, returns the same bgra texture render_shader would."""
+        map1, map2, extent = self.get_warp_grid(bbox_center, bbox_size, inflate_size, frame_size)
+        # the grid is anchored on the center's pixel, shift it so it indexes into the roi instead
+        left = int(np.floor(bbox_center.x)) - extent
+        top = int(np.floor(bbox_center.y)) - extent
+        x1, y1 = origin[0] - left, origin[1] - top
+        h, w = mask_crop.shape[:2]
+        map1 = map1[y1:y1 + h, x1:x1 + w] - np.array((x1, y1), dtype=np.int16)
+        map2 = map2[y1:y1 + h, x1:x1 + w]
+
+        source = cv2.cvtColor(frame_crop, cv2.COLOR_BGR2BGRA)
+        source[..., 3] = mask_crop
+        # clamp to edge like the shader's sampler
+        return cv2.remap(source, map1, map2, cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
+
     # below function customizes the inspector UI, see example_ui for the format
   
     
@@ -6,6 +6,7 @@ class MaskingTape(FX):
     def setup(self):
         self.requires_mask = True # if your fx requires segmentation of objects
         self.requires_inpainting = False # if your fx requires inpainting of objects
+        self.frame_independent = True
         self.requires_sprites = True # if your fx requires sprites to manipulate objects
         
 
@@ -40,20 +41,63 @@ class MaskingTape(FX):
 
         bg_color = self.get_meta("background_color", None)
         if bg_color:
-            frame_info.render_buffer[:] = np.array(bg_color)
-        
-        original_frame = frame_info.frame.copy()
+            frame_info.render_buffer[:] = bg_color
+
         for sprite in self.sprite_manager.sprites:
-            if sprite.type == "cutout":
-                color = sprite.get_meta("foreground_color", None)
-                
-                if color is not None:
-                    frame_info.frame = original_frame.copy()
-                    frame_info.frame[:] = color  # Fill the entire frame with the foreground color
-       
-              
-            
-            sprite.render(frame_info)
-            frame_info.frame = original_frame.copy()
-
-    
\ No newline at end of file
+            color = sprite.get_meta("foreground_color", None) if sprite.type == "cutout" else None
+            stamp = self.get_stamp_verdict(sprite, color) if self.can_stamp(sprite) else False
+            if color is None:
+                sprite.render(frame_info)
+            elif stamp:
+                self.stamp_color(frame_info.render_buffer, sprite, color)
+            elif stamp is None:
+                self.verify_stamp(frame_info, sprite, color)
+            else:
+                self.render_color(frame_info, sprite, color)
+
+    def get_sprite_rect(self, sprite, frame):
+        x1, y1, x2, y2 = [int(v) for v in sprite.bbox]
+        h, w = frame.shape[:2]
+        return max(x1, 0), max(y1, 0), min(x2, w), min(y2, h)
+
+    def can_stamp(self, sprite):
+        # an untransformed cutout with a normal blend lands on its bbox, so it might be written without sprite.render
+        return sprite.mask is not None and not sprite.is_transformed() and sprite.blend_mode.lower() == "normal"
+
+    def stamp_color(self, buffer, sprite, color):
+        # the solid color goes straight into the buffer under the mask, within the bbox only
+        x1, y1, x2, y2 = self.get_sprite_rect(sprite, buffer)
+        if x2 <= x1 or y2 <= y1:
+            return
+        mask = sprite.mask[y1:y2, x1:x2]
+        if mask.dtype == bool:
+            mask = mask.view(np.uint8)
+        target = buffer[y1:y2, x1:x2]
+        cv2.copyTo(np.full_like(target, color), mask, target)
+
+    def get_stamp_verdict(self, sprite, color):
+        # whether a stamp matched the host for the sprite as it is now, None if it has not been checked like this
+        verdict = getattr(sprite, "stamp_verdict", None)
+        inputs = (sprite.type, sprite.mask is not None, tuple(color), sprite.blend_mode)
+        return verdict[1] if verdict is not None and verdict[0] == inputs else None
+
+    def verify_stamp(self, frame_info, sprite, color):
+        # the host renders the sprite, and it is stamped from then on if a stamp gives exactly the same pixels
+        x1, y1, x2, y2 = self.get_sprite_rect(sprite, frame_info.render_buffer)
+        if x2 <= x1 or y2 <= y1 or cv2.countNonZero(sprite.mask[y1:y2, x1:x2].view(np.uint8)) == 0:
+            # nothing on screen to compare yet
+            self.render_color(frame_info, sprite, color)
+            return
+        stamped = frame_info.render_buffer.copy()
+        self.stamp_color(stamped, sprite, color)
+        self.render_color(frame_info, sprite, color)
+        inputs = (sprite.type, sprite.mask is not None, tuple(color), sprite.blend_mode)
+        sprite.stamp_verdict = (inputs, np.array_equal(stamped, frame_info.render_buffer))
+
+    def render_color(self, frame_info, sprite, color):
+        # transformed sprites and other blends go through the host renderer, with the color filled into the bbox of the frame only
+        x1, y1, x2, y2 = self.get_sprite_rect(sprite, frame_info.frame)
+        saved = frame_info.frame[y1:y2, x1:x2].copy()
+        frame_info.frame[y1:y2, x1:x2] = color
+        sprite.render(frame_info)
+        frame_info.frame[y1:y2, x1:x2] = saved
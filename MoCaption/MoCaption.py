@@ -1,11 +1,19 @@
+from collections import OrderedDict
+
 import numpy as np
 import cv2
 from fx_api.fx import FX, FrameInfo
 from fx_api.utils.vector import Vector
+from fx_api.utils.image import ImageUtils
 class MoCaption(FX):
     def setup(self):
         self.requires_mask = True # if your fx requires segmentation of objects
         self.requires_inpainting = False # if your fx requires inpainting of objects
+        self.frame_independent = True
+        self.caption_meta_keys = ("text", "font", "font_size", "color") # sprite meta that changes how a caption rasterizes
+        self.caption_cache = OrderedDict() # (caption meta, scale and rotation) -> (bgra caption bitmap, its offset from the caption center), least recently used first
+        self.caption_cache_size = 64
+        self.capture_canvases = None # black and white canvases the host renders a caption onto on a cache miss, only the caption's box is used
 
     def get_custom_inspector(self):
         return [
@@ -33,4 +41,92 @@ class MoCaption(FX):
         
 
     def render_frame(self, frame_info: FrameInfo):
-        super().render_frame(frame_info)
\ No newline at end of file
+        # captions are rasterized by the host once and then only moved, everything else renders as usual
+        for sprite in self.sprite_manager.sprites:
+            if sprite.type == "text":
+                self.render_caption(frame_info, sprite)
+            else:
+                sprite.render(frame_info)
+
+    def get_caption_key(self, sprite):
+        # the caption's look plus where its corners sit relative to its center, so scaling or rotating it re-rasterizes
+        center = sprite.normalized_point_to_global(Vector(0, 0))
+        corners = [sprite.normalized_point_to_global(Vector(*corner)) - center for corner in ((1, 1), (1, -1))]
+        shape = tuple(round(float(v), 2) for corner in corners for v in corner)
+        meta = tuple(repr(sprite.get_meta(key)) for key in self.caption_meta_keys)
+        return (meta, shape), center
+
+    def get_caption_rect(self, sprite, width, height):
+        # the caption's box on the frame, grown by a couple of pixels for anti-aliasing, None if any of it is off the frame
+        points = [sprite.normalized_point_to_global(Vector(x, y)) for x in (-1, 1) for y in (-1, 1)]
+        x1 = int(np.floor(min(point[0] for point in points))) - 2
+        y1 = int(np.floor(min(point[1] for point in points))) - 2
+        x2 = int(np.ceil(max(point[0] for point in points))) + 2
+        y2 = int(np.ceil(max(point[1] for point in points))) + 2
+        if x1 < 0 or y1 < 0 or x2 > width or y2 > height:
+            return None
+        return x1, y1, x2, y2
+
+    def render_caption(self, frame_info: FrameInfo, sprite):
+        key, center = self.get_caption_key(sprite)
+        cx, cy = int(center[0]), int(center[1])
+        entry = self.caption_cache.get(key)
+        # a caption whose look changed since its last frame is being animated, and would miss again on the next one
+        steady = getattr(sprite, "caption_key", key) == key
+        sprite.caption_key = key
+        if entry is None and steady:
+            entry = self.capture_caption(frame_info, sprite, cx, cy)
+            if entry is not None:
+                self.caption_cache[key] = entry
+                if len(self.caption_cache) > self.caption_cache_size:
+                    self.caption_cache.popitem(last=False)
+        if entry is None:
+            # animated, cut off by the frame edge or drawn past its box, the host renders it as it is
+            sprite.render(frame_info)
+            return
+        self.caption_cache.move_to_end(key)
+        bitmap, dx, dy = entry
+        ImageUtils.blend(frame_info.render_buffer, bitmap, Vector(cx + dx, cy + dy), centered=False, blend_mode=sprite.blend_mode)
+
+    def capture_caption(self, frame_info: FrameInfo, sprite, cx, cy):
+        """
+        Has the host render the caption over black and then over white, the difference between the two is its alpha.
+        Only the caption's box is cleared and read back. Returns (bgra bitmap, its offset from the caption center),
+        or None if the caption can not be captured whole: partly off the frame, drawn up to the edge of its box, or empty.
+        """
+        if not getattr(sprite, "caption_fits", True):
+            return None
+        height, width = frame_info.render_buffer.shape[:2]
+        rect = self.get_caption_rect(sprite, width, height)
+        if rect is None:
+            return None
+        x1, y1, x2, y2 = rect
+        if self.capture_canvases is None or self.capture_canvases[0].shape[:2] != (height, width):
+            # frame sized, as the host draws at frame coordinates
+            self.capture_canvases = [np.empty((height, width, 3), dtype=np.uint8) for _ in range(2)]
+        black, white = [canvas[y1:y2, x1:x2] for canvas in self.capture_canvases]
+        black[:] = 0
+        white[:] = 255
+
+        blend_mode = sprite.blend_mode
+        sprite.blend_mode = "Normal"
+        for canvas in self.capture_canvases:
+            frame_info.override_buffer = canvas
+            sprite.render(frame_info)
+        frame_info.override_buffer = None
+        sprite.blend_mode = blend_mode
+
+        untouched = cv2.bitwise_and(cv2.inRange(black, (0, 0, 0), (0, 0, 0)), cv2.inRange(white, (255, 255, 255), (255, 255, 255)))
+        x, y, w, h = cv2.boundingRect(cv2.bitwise_not(untouched))
+        if w == 0 or h == 0:
+            return None
+        if x == 0 or y == 0 or x + w == x2 - x1 or y + h == y2 - y1:
+            # the host draws this caption past its box, so the box can not be trusted to hold it
+            sprite.caption_fits = False
+            return None
+        black, white = black[y:y+h, x:x+w], white[y:y+h, x:x+w]
+
+        # over black the host leaves color * alpha, over white color * alpha + 255 * (1 - alpha)
+        alpha = 255 - np.max(cv2.subtract(white, black), axis=2)
+        color = cv2.divide(black, cv2.merge((alpha, alpha, alpha)), scale=255)
+        return cv2.merge((*cv2.split(color), alpha)), x1 + x - cx, y1 + y - cy
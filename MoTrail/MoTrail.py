@@ -7,9 +7,12 @@ class MoTrail(FX):
     def setup(self):
         self.requires_mask = True  # if your fx requires segmentation of objects
         self.requires_inpainting = False  # if your fx requires inpainting of objects
+        self.frame_independent = False  # the trail buffer carries over from frame to frame
+        self.tile_size = 64 # trail bookkeeping granularity in pixels
+        self.fade_lut = None
+        self.fade_lut_length = None
         
-        res = self.api.get_resolution()
-        self.buffer = np.zeros((res[1], res[0], 4), dtype=np.uint8)  # Create an empty nparray with alpha channel
+        self.clear_buffer()
 
     
 
@@ -60,7 +63,92 @@ class MoTrail(FX):
 
     def clear_buffer(self):
         res = self.api.get_resolution()
-        self.buffer = np.zeros((res[1], res[0], 4), dtype=np.uint8)  # Create an empty nparray with alpha channel
+        tiles_y = -(-res[1] // self.tile_size)
+        tiles_x = -(-res[0] // self.tile_size)
+        # the buffer is padded up to whole tiles so tiles can be reduced with a reshape, the frame sized view is what sprites render into
+        self.tile_buffer = np.zeros((tiles_y * self.tile_size, tiles_x * self.tile_size, 4), dtype=np.uint8)  # Create an empty nparray with alpha channel
+        self.buffer = self.tile_buffer[:res[1], :res[0]]
+        self.live_tiles = np.zeros((tiles_y, tiles_x), dtype=bool)
+
+    def get_fade_lut(self, trail_length):
+        # per channel lookup table that leaves bgr untouched and fades alpha to int(a * fade_factor), rebuilt only when the trail length changes
+        if trail_length != self.fade_lut_length:
+            fade_factor = 0.6 + trail_length / 250
+            identity = np.arange(256, dtype=np.uint8)
+            faded = (np.arange(256) * fade_factor).astype(np.uint8)
+            self.fade_lut = np.dstack((identity, identity, identity, faded)).reshape(1, 256, 4)
+            self.fade_lut_length = trail_length
+        return self.fade_lut
+
+    def get_warmup_frames(self):
+        """
+        Frames an export chunk has to start early to match a serial render exactly, None if only a serial render will do.
+
+        Only stamped trails are exact. A stamp writes the trail color with an alpha of 255, so a pixel's alpha is 255
+        faded once per frame since it was last stamped, whatever came before, and once that is 0 its old bgr no longer
+        shows either. Each fade truncates, so after n frames alpha is at most 255 * fade_factor^n, which is below 1 for
+        n = floor(log(255) / -log(fade_factor)) + 1 and a fresh fx has caught up. Trails the host renders (transformed
+        sprites, soft edges, other blends) mix into the bgr and alpha already in the buffer, which carry the whole history.
+        Stamps are only used once verify_stamp has checked them against the host for a sprite's current trail color,
+        so this is None until a frame has been rendered.
+        """
+        fade_factor = 0.6 + self.get_meta("trail_length", 50) / 250
+        if fade_factor >= 1:
+            return None
+        if not all(self.always_stamps(sprite) for sprite in self.sprite_manager.sprites):
+            return None
+        return int(np.floor(np.log(255) / -np.log(fade_factor))) + 1
+
+    def always_stamps(self, sprite):
+        # whether can_stamp holds on every frame, judged from the keyframes: Normal trail blend and no transform.
+        # Transform keys this does not know are taken as a transform, a serial export is never wrong
+        if sprite.type != "cutout" or not self.get_stamp_verdict(sprite, sprite.get_meta("trail_color", None), "Normal"):
+            return False
+        identity = {"scale": (1.0, 1.0), "translation": (0, 0), "rotation": 0}
+        keyframes = sprite.keyframes
+        blends = [sprite.get_meta("trail_blend", "Normal")] + [(getattr(keyframe, "meta", None) or {}).get("trail_blend", "Normal") for keyframe in keyframes]
+        if any(blend != "Normal" for blend in blends):
+            return False
+        for keyframe in keyframes:
+            for key, value in keyframe.transform.items():
+                if key not in identity or tuple(np.ravel(value)) != tuple(np.ravel(identity[key])):
+                    return False
+        return True
+
+    def get_dirty_rect(self):
+        # pixel rect of the bounding box of all tiles that still hold some trail, or None
+        rows = np.flatnonzero(self.live_tiles.any(axis=1))
+        if rows.size == 0:
+            return None
+        cols = np.flatnonzero(self.live_tiles.any(axis=0))
+        t = self.tile_size
+        return cols[0] * t, rows[0] * t, (cols[-1] + 1) * t, (rows[-1] + 1) * t
+
+    def drop_dead_tiles(self, rect):
+        # tiles whose alpha has fully decayed no longer need to be faded or composited
+        x1, y1, x2, y2 = rect
+        t = self.tile_size
+        alpha = self.tile_buffer[y1:y2, x1:x2, 3]
+        tile_max = alpha.reshape((y2 - y1) // t, t, (x2 - x1) // t, t).max(axis=(1, 3))
+        self.live_tiles[y1 // t:y2 // t, x1 // t:x2 // t] &= tile_max > 0
+
+    def mark_sprite_tiles(self, sprite):
+        # union of the source bbox and the transformed sprite corners, so moved/scaled sprites are covered too
+        x1, y1, x2, y2 = sprite.bbox
+        xs = [x1, x2]
+        ys = [y1, y2]
+        for corner in (Vector(-1, -1), Vector(1, -1), Vector(-1, 1), Vector(1, 1)):
+            x, y = sprite.normalized_point_to_global(corner)
+            xs.append(x)
+            ys.append(y)
+
+        t = self.tile_size
+        ty, tx = self.live_tiles.shape
+        tx1 = min(max(int(min(xs)) // t - 1, 0), tx)
+        ty1 = min(max(int(min(ys)) // t - 1, 0), ty)
+        tx2 = min(max(int(max(xs)) // t + 2, 0), tx)
+        ty2 = min(max(int(max(ys)) // t + 2, 0), ty)
+        self.live_tiles[ty1:ty2, tx1:tx2] = True
 
     def render_frame(self, frame_info: FrameInfo):
         #super().render_frame(frame_info)
@@ -68,41 +156,93 @@ class MoTrail(FX):
         if frame_info.index == 0:
             self.clear_buffer()
         else:
-            fade_factor = 0.6 + self.get_meta("trail_length", 50) / 250
-            self.buffer[..., 3] = (self.buffer[..., 3] * fade_factor).astype(np.uint8)
-
-        original_frame = frame_info.frame.copy()
-        
+            # only the tiles that still hold trail are faded
+            rect = self.get_dirty_rect()
+            if rect is not None:
+                x1, y1, x2, y2 = rect
+                trail = self.tile_buffer[y1:y2, x1:x2]
+                cv2.LUT(trail, self.get_fade_lut(self.get_meta("trail_length", 50)), dst=trail)
+                self.drop_dead_tiles(rect)
 
         for sprite in self.sprite_manager.sprites:
-            enable_trail = sprite.get_meta("enable_trail", True)
-            frame_info.override_buffer = self.buffer if enable_trail else None
+            if not sprite.get_meta("enable_trail", True):
+                continue
+            self.mark_sprite_tiles(sprite)
             trail_color = sprite.get_meta("trail_color", None)
-        
-            if trail_color is not None:
-                frame_info.frame[:] = trail_color 
-            else:
-                frame_info.frame = original_frame
-            
-            original_blend = sprite.blend_mode
-            sprite.blend_mode = sprite.get_meta("trail_blend", "Normal")
-            sprite.render(frame_info)
-            sprite.blend_mode = original_blend
+            trail_blend = sprite.get_meta("trail_blend", "Normal")
 
-            
-            
+            stamp = self.get_stamp_verdict(sprite, trail_color, trail_blend) if trail_blend == "Normal" and self.can_stamp(sprite) else False
+            if stamp:
+                self.stamp_trail(self.buffer, frame_info, sprite, trail_color)
+            elif stamp is None:
+                self.verify_stamp(frame_info, sprite, trail_color)
+            else:
+                self.render_trail(frame_info, sprite, trail_color, trail_blend)
 
-        ImageUtils.blend(frame_info.render_buffer, self.buffer, Vector(0,0), centered=False, blend_mode="normal")
+        rect = self.get_dirty_rect()
+        if rect is not None:
+            x1, y1, x2, y2 = rect
+            ImageUtils.blend(frame_info.render_buffer, self.buffer[y1:y2, x1:x2], Vector(x1,y1), centered=False, blend_mode="normal")
 
-        frame_info.frame = original_frame
         for sprite in self.sprite_manager.sprites:
-            frame_info.override_buffer = None
             sprite.render(frame_info)
 
-        
-
-
-
-                
-
-
+    def get_sprite_rect(self, sprite):
+        x1, y1, x2, y2 = [int(v) for v in sprite.bbox]
+        h, w = self.buffer.shape[:2]
+        return max(x1, 0), max(y1, 0), min(x2, w), min(y2, h)
+
+    def can_stamp(self, sprite):
+        # an untransformed cutout lands on its bbox, so its trail might be written without going through sprite.render
+        return sprite.type == "cutout" and sprite.mask is not None and not sprite.is_transformed()
+
+    def stamp_trail(self, buffer, frame_info, sprite, trail_color):
+        # Normal blend of an opaque cutout is a copy under the mask, done on the bbox crop only
+        x1, y1, x2, y2 = self.get_sprite_rect(sprite)
+        if x2 <= x1 or y2 <= y1:
+            return
+        inside = sprite.mask[y1:y2, x1:x2] > 0
+        trail = buffer[y1:y2, x1:x2]
+        if trail_color is not None:
+            color = np.array(trail_color, dtype=np.uint8)
+        else:
+            color = frame_info.frame[y1:y2, x1:x2]
+        np.copyto(trail[..., :3], color, where=inside[..., None])
+        np.copyto(trail[..., 3], 255, where=inside)
+
+    def get_stamp_verdict(self, sprite, trail_color, trail_blend):
+        # whether a stamp matched the host for the sprite's trail as it is now, None if it has not been checked like this
+        verdict = getattr(sprite, "stamp_verdict", None)
+        inputs = (sprite.type, sprite.mask is not None, None if trail_color is None else tuple(trail_color), trail_blend)
+        return verdict[1] if verdict is not None and verdict[0] == inputs else None
+
+    def verify_stamp(self, frame_info, sprite, trail_color):
+        # the host renders the trail, and it is stamped from then on if a stamp gives exactly the same buffer
+        x1, y1, x2, y2 = self.get_sprite_rect(sprite)
+        if x2 <= x1 or y2 <= y1 or not (sprite.mask[y1:y2, x1:x2] > 0).any():
+            # nothing on screen to compare yet
+            self.render_trail(frame_info, sprite, trail_color, "Normal")
+            return
+        stamped = self.buffer.copy()
+        self.stamp_trail(stamped, frame_info, sprite, trail_color)
+        self.render_trail(frame_info, sprite, trail_color, "Normal")
+        inputs = (sprite.type, sprite.mask is not None, None if trail_color is None else tuple(trail_color), "Normal")
+        sprite.stamp_verdict = (inputs, np.array_equal(stamped, self.buffer))
+
+    def render_trail(self, frame_info, sprite, trail_color, trail_blend):
+        # transformed sprites and other blends go through the host renderer, with the trail color filled only inside the bbox
+        saved = None
+        if trail_color is not None:
+            x1, y1, x2, y2 = self.get_sprite_rect(sprite)
+            saved = frame_info.frame[y1:y2, x1:x2].copy()
+            frame_info.frame[y1:y2, x1:x2] = trail_color
+
+        original_blend = sprite.blend_mode
+        sprite.blend_mode = trail_blend
+        frame_info.override_buffer = self.buffer
+        sprite.render(frame_info)
+        frame_info.override_buffer = None
+        sprite.blend_mode = original_blend
+
+        if saved is not None:
+            frame_info.frame[y1:y2, x1:x2] = saved
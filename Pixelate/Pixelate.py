@@ -1,3 +1,4 @@
+from collections import OrderedDict
 import numpy as np
 import cv2
 from fx_api.fx import FX, FrameInfo
@@ -6,6 +7,17 @@ class Pixelate(FX):
     def setup(self):
         self.requires_mask = True # if your fx requires segmentation of objects
         self.requires_inpainting = True # if your fx requires inpainting of objects
+        self.frame_independent = True
+        self.inpainting = None # (frame index, inpainted frame) of the current render pass
+        self.mask_cache = OrderedDict() # (object id, frame index, roi, radius) -> grown mask, least recently used first
+        self.mask_cache_size = 64
+        self.noise_seed = 0 # seeds the recolor noise texture, which is offset per sprite and frame so every render of a frame is the same
+        self.noise_tile_size = 256
+        self.noise_tile = None
+        self.recolor_textures = OrderedDict() # pixel_color -> noisy recolor texture tiled to cover the largest roi so far, least recently used first
+        self.recolor_textures_size = 4
+        self.sprite_meta_defaults = {"pixel_size": 1, "pixel_color": None, "expansion": 10, "use_inpaint": True} # every sprite meta key read while rendering
+        self.meta_snapshot = None # (frame index, [(sprite, resolved sprite meta)] in sprite order), taken once per frame
 
     def get_custom_inspector(self):
         return [
@@ -53,31 +65,134 @@ class Pixelate(FX):
         
     # override to not show inpainting by default
     def render_background(self, frame_info: FrameInfo):
+        self.inpainting = None
         pixelate = False
-        for sprite in self.sprite_manager.sprites:
-            pixel_size = sprite.get_meta("pixel_size", 1)
-            use_inpaint = sprite.get_meta("use_inpaint", True)
-            if pixel_size > 1 and use_inpaint:
+        for sprite, meta in self.get_meta_snapshot(frame_info):
+            if meta["pixel_size"] > 1 and meta["use_inpaint"]:
                 pixelate = True
         
         if pixelate:
-            frame_info.render_buffer = self.api.get_inpainting(frame_info)
+            frame_info.render_buffer = self.get_inpainting(frame_info).copy()
         else:
             frame_info.render_buffer = frame_info.frame.copy()
 
+    def get_meta_snapshot(self, frame_info: FrameInfo):
+        # resolves every key in sprite_meta_defaults once per sprite and frame, render_background and render_frame share it.
+        # It is retaken if the sprites were added, removed or reordered since
+        sprites = self.sprite_manager.sprites
+        if (self.meta_snapshot is None or self.meta_snapshot[0] != frame_info.index
+                or len(self.meta_snapshot[1]) != len(sprites)
+                or any(taken is not sprite for (taken, _), sprite in zip(self.meta_snapshot[1], sprites))):
+            snapshot = [(sprite, {key: sprite.get_meta(key, default) for key, default in self.sprite_meta_defaults.items()}) for sprite in sprites]
+            self.meta_snapshot = (frame_info.index, snapshot)
+        return self.meta_snapshot[1]
+
+    def get_inpainting(self, frame_info: FrameInfo):
+        # fetched once per render pass and shared by the background and every sprite, so copy before writing to it.
+        # render_background drops it as the host's inpainting selection can change between passes
+        if self.inpainting is None or self.inpainting[0] != frame_info.index:
+            self.inpainting = (frame_info.index, self.api.get_inpainting(frame_info))
+        return self.inpainting[1]
+
+    def get_buffer(self, sprite, name, shape):
+        # per sprite scratch buffers kept between frames, only reallocated when the roi outgrows them
+        if not hasattr(sprite, "pixelate_buffers"):
+            sprite.pixelate_buffers = {}
+        buffer = sprite.pixelate_buffers.get(name)
+        if buffer is None or any(have < need for have, need in zip(buffer.shape, shape)):
+            size = shape if buffer is None else tuple(max(have, need) for have, need in zip(buffer.shape, shape))
+            buffer = np.empty(size, dtype=np.uint8)
+            sprite.pixelate_buffers[name] = buffer
+        return buffer[tuple(slice(0, n) for n in shape)]
+
+    def expand_mask(self, key, mask, radius):
+        """
+        Grows a binary mask by radius pixels in a single pass, whatever the radius.
+
+        Thresholds the L1 distance to the nearest mask pixel at radius, which grows the mask
+        by a diamond, the shape that radius / 2 passes of a 5x5 cross dilation approximate.
+        Results are memoized on key + radius so re-rendering or scrubbing over the same frame
+        does not grow the mask again, a None key is not memoized.
+
+        Returns a read-only uint8 mask holding the same "on" value as the input.
+        """
+        key = key + (radius,) if key is not None else None
+        grown = self.mask_cache.get(key) if key is not None else None
+        if grown is not None:
+            self.mask_cache.move_to_end(key)
+            return grown
+
+        on_value = cv2.minMaxLoc(mask)[1] or 1
+        outside = cv2.compare(mask, 0, cv2.CMP_EQ)
+        # exact l1 distances fit in uint8 up to 255px, further than that is outside any slider radius anyway
+        distance = cv2.distanceTransform(outside, cv2.DIST_L1, 3, dstType=cv2.CV_8U)
+        _, grown = cv2.threshold(distance, radius, on_value, cv2.THRESH_BINARY_INV)
+
+        grown.flags.writeable = False
+        if key is None:
+            return grown
+        self.mask_cache[key] = grown
+        if len(self.mask_cache) > self.mask_cache_size:
+            self.mask_cache.popitem(last=False)
+        return grown
+
+    def get_recolor_texture(self, pixel_color, height, width):
+        """
+        Returns a bgr texture of at least (height + tile, width + tile) holding pixel_color with noise on its value.
+
+        The recolor keeps pixel_color's hue and saturation and adds np.random.normal(-10, 10) to its value, so
+        one tile of noise is drawn once and turned into colors with a 256 entry lut, any roi sized window of it
+        is as good as fresh noise once pixelated.
+        """
+        t = self.noise_tile_size
+        if self.noise_tile is None:
+            self.noise_tile = np.random.default_rng(self.noise_seed).standard_normal((t, t), dtype=np.float32)
+
+        key = tuple(int(c) for c in pixel_color)
+        texture = self.recolor_textures.get(key)
+        if texture is not None:
+            self.recolor_textures.move_to_end(key)
+        if texture is None or texture.shape[0] < height + t or texture.shape[1] < width + t:
+            pixel_color_hsv = cv2.cvtColor(np.uint8([[key]]), cv2.COLOR_BGR2HSV)[0][0]
+            hsv = np.empty((256, 1, 3), dtype=np.uint8)
+            hsv[..., 0] = pixel_color_hsv[0]
+            hsv[..., 1] = pixel_color_hsv[1]
+            hsv[:, 0, 2] = np.arange(256)
+            lut = cv2.cvtColor(hsv, cv2.COLOR_HSV2BGR).reshape(256, 3)
+
+            # truncated to uint8 like the old per frame noise
+            values = np.clip(pixel_color_hsv[2] - 10 + self.noise_tile * 10, 0, 255).astype(np.uint8)
+            tile = lut[values]
+            reps_y = -(-(height + t) // t)
+            reps_x = -(-(width + t) // t)
+            texture = np.tile(tile, (reps_y, reps_x, 1))
+            self.recolor_textures[key] = texture
+            if len(self.recolor_textures) > self.recolor_textures_size:
+                self.recolor_textures.popitem(last=False)
+        return texture
+
+    def recolor(self, sprite, frame_info, crop, mask_crop, pixel_color):
+        # copies a window of the noise texture into crop under the mask, the window moves per sprite and frame
+        height, width = mask_crop.shape
+        texture = self.get_recolor_texture(pixel_color, height, width)
+        sprite_key = sprite.object_info.id if getattr(sprite, "object_info", None) is not None else self.sprite_manager.sprites.index(sprite)
+        oy, ox = np.random.default_rng((self.noise_seed, sprite_key, frame_info.index)).integers(0, self.noise_tile_size, 2)
+        cv2.copyTo(texture[oy:oy + height, ox:ox + width], mask_crop, crop)
 
     def render_frame(self, frame_info: FrameInfo):
         #super().render_frame(frame_info)
 
 
 
-        for sprite in self.sprite_manager.sprites:
-
-            pixel_size = sprite.get_meta("pixel_size", 1)
-            pixel_color = sprite.get_meta("pixel_color", None)
+        snapshot = self.get_meta_snapshot(frame_info)
+        # render_frame is the last to use the snapshot, the next render of this frame takes a fresh one in case meta changed
+        self.meta_snapshot = None
+        for sprite, meta in snapshot:
+            pixel_size = meta["pixel_size"]
+            pixel_color = meta["pixel_color"]
             if pixel_size > 1:
                 bbox = sprite.bbox
-                expansion = sprite.get_meta("expansion", 10)
+                expansion = meta["expansion"]
                 original_width = bbox[2] - bbox[0]
                 original_height = bbox[3] - bbox[1]
                 if original_width == 0 or original_height == 0:
@@ -96,73 +211,43 @@ class Pixelate(FX):
                 sprite.bbox = expanded_bbox
                 width = expanded_bbox[2] - expanded_bbox[0]
                 height = expanded_bbox[3] - expanded_bbox[1]
-                use_inpaint = sprite.get_meta("use_inpaint", True)
-                if use_inpaint:
-                    frame_crop = self.api.get_inpainting(frame_info)
+                x1, y1, x2, y2 = expanded_bbox
+                small_size = (max(round(width / pixel_size), 1), max(round(height / pixel_size), 1))
+                if meta["use_inpaint"]:
+                    source = self.get_inpainting(frame_info)
                 else:
-                    frame_crop = frame_info.frame.copy()
+                    source = frame_info.frame
                 
-                frame_crop = frame_crop[expanded_bbox[1]:expanded_bbox[3], expanded_bbox[0]:expanded_bbox[2]]
+                # everything below works on views of the roi and per sprite buffers, nothing full frame is copied
+                frame_crop = source[y1:y2, x1:x2]
                 mask_crop = np.ones((height, width), dtype=np.uint8)
                 if sprite.mask is not None:
-                    mask_crop = sprite.mask.copy().astype(np.uint8)[expanded_bbox[1]:expanded_bbox[3], expanded_bbox[0]:expanded_bbox[2]]
+                    mask_crop = sprite.mask[y1:y2, x1:x2]
+                    if mask_crop.dtype == bool:
+                        mask_crop = mask_crop.view(np.uint8)
                    
-                    mask_crop = cv2.dilate(mask_crop, cv2.getStructuringElement(cv2.MORPH_CROSS, (5, 5)), iterations=int(expansion / 2))
+                    # only a tracked object's mask is the same on every render of a frame, other sprites are grown afresh
+                    object_info = getattr(sprite, "object_info", None)
+                    key = (object_info.id, frame_info.index, expanded_bbox) if object_info is not None else None
+                    # same reach as the old int(expansion / 2) passes of a 5x5 cross dilation
+                    dilated = self.expand_mask(key, mask_crop, 2 * int(expansion / 2))
             
-                    mask_crop = cv2.resize(mask_crop, (0, 0), fx=1/pixel_size, fy=1/pixel_size, interpolation=cv2.INTER_NEAREST)
-                    mask_crop = cv2.resize(mask_crop, (width,height), interpolation=cv2.INTER_NEAREST)
-                    sprite.mask[expanded_bbox[1]:expanded_bbox[3], expanded_bbox[0]:expanded_bbox[2]] = mask_crop
+                    mask_small = self.get_buffer(sprite, "mask_small", small_size[::-1])
+                    cv2.resize(dilated, small_size, dst=mask_small, interpolation=cv2.INTER_NEAREST)
+                    cv2.resize(mask_small, (width, height), dst=mask_crop, interpolation=cv2.INTER_NEAREST)
 
                 if pixel_color is not None:
-                    # Convert the frame_crop to HSV color space
-                    hsv_frame_crop = cv2.cvtColor(frame_crop, cv2.COLOR_BGR2HSV)
-                    
-                    # Calculate the average V value in the masked area
-                    # masked_v_values = hsv_frame_crop[mask_crop > 0, 2]
-                    # average_v = np.mean(masked_v_values) if masked_v_values.size > 0 else 0
-
-                    # Create a new color in HSV with the same H and S as pixel_color, but with the average V
-                    pixel_color_hsv = cv2.cvtColor(np.uint8([[pixel_color]]), cv2.COLOR_BGR2HSV)[0][0]
-                    
-                    
-                    # Convert back to BGR color space
-                    new_pixel_color = cv2.cvtColor(np.uint8([[pixel_color_hsv]]), cv2.COLOR_HSV2BGR)[0][0]
-                    # Calculate the new V value for the recolored pixels
-                    new_pixel_color_v = pixel_color_hsv[2]
-                    # recolored_v = hsv_frame_crop[..., 2] - average_v + new_pixel_color_v
-                    # recolored_v = np.clip(recolored_v, 0, 255)  # Ensure V values are within valid range
-                    noise = np.random.normal(-10, 10, hsv_frame_crop[..., 2].shape)  # Generate noise
-                    recolored_v = new_pixel_color_v + noise  # Add noise to the new V value
-                    recolored_v = np.clip(recolored_v, 0, 255)  # Ensure V values are within valid range
-
-                    # Create a new HSV image with the modified V channel
-                    recolored_hsv_frame_crop = hsv_frame_crop.copy()
-                    recolored_hsv_frame_crop[..., 2] = recolored_v
-                    recolored_hsv_frame_crop[..., 1] = pixel_color_hsv[1]
-                    recolored_hsv_frame_crop[..., 0] = pixel_color_hsv[0]
-
-                    # Convert back to BGR color space
-                    recolored_frame_crop = cv2.cvtColor(recolored_hsv_frame_crop, cv2.COLOR_HSV2BGR)
-                    
-                    # Change the color of the pixels inside the masked area
-                    mask_indices = np.where(mask_crop > 0)
-                    frame_crop[mask_indices] = recolored_frame_crop[mask_indices]
-                
-                    
-
-                   
+                    # the recolor writes into the crop, so it works on a copy of the roi only
+                    crop = self.get_buffer(sprite, "crop", (height, width, 3))
+                    np.copyto(crop, frame_crop)
+                    frame_crop = crop
 
-                    
+                    self.recolor(sprite, frame_info, frame_crop, mask_crop, pixel_color)
                 
-                # Pixelate the frame
-                frame_crop = cv2.resize(frame_crop, (0, 0), fx=1/pixel_size, fy=1/pixel_size, interpolation=cv2.INTER_NEAREST)
-                
-                frame_crop = cv2.resize(frame_crop, (width, height), interpolation=cv2.INTER_NEAREST)
-
-                
-
-                # Update the sprite's frame with the pixelated version
-                frame_info.frame[expanded_bbox[1]:expanded_bbox[3], expanded_bbox[0]:expanded_bbox[2]] = frame_crop
+                # Pixelate the roi, averaging on the way down and writing the blocks straight back into the frame on the way up
+                frame_small = self.get_buffer(sprite, "frame_small", small_size[::-1] + (3,))
+                cv2.resize(frame_crop, small_size, dst=frame_small, interpolation=cv2.INTER_AREA)
+                cv2.resize(frame_small, (width, height), dst=frame_info.frame[y1:y2, x1:x2], interpolation=cv2.INTER_NEAREST)
             sprite.render(frame_info)
                 
 
@@ -8,6 +8,7 @@ class Playground(FX):
     def setup(self):
         self.requires_mask = True # if your fx requires segmentation of objects
         self.requires_inpainting = True # if your fx requires inpainting of objects
+        self.frame_independent = True
 
         # a simple shader to convert the image to grayscale
         grayscale_shader = r"""
@@ -22,7 +23,12 @@ class Playground(FX):
         }
         """
 
-        self.api.set_fragment_shader(grayscale_shader)
+        # without a gl context (a headless render worker) the host may refuse the shader, render_shader_cpu stands in then
+        try:
+            self.api.set_fragment_shader(grayscale_shader)
+            self.use_shader = True
+        except Exception:
+            self.use_shader = False
    
 
     # called when the fx is ready
@@ -35,10 +41,25 @@ class Playground(FX):
         # to render the grayscale shader, uncomment the following code
         # self.render_shader(frame_info)
 
+    def render_shader_cpu(self, uniforms):
+        # same as the grayscale shader, cvtColor uses the same 0.299, 0.587, 0.114 weights
+        gray = cv2.cvtColor(uniforms["texSampler"], cv2.COLOR_BGR2GRAY)
+        return cv2.merge((gray, gray, gray, np.full_like(gray, 255)))
+
     def render_shader(self, frame_info: FrameInfo):
-        new_tex = self.api.render_shader({
+        uniforms = {
             "texSampler": frame_info.frame
-        })
+        }
+        new_tex = None
+        if self.use_shader:
+            # or it takes the shader and only fails to render it
+            try:
+                new_tex = self.api.render_shader(uniforms)
+            except Exception:
+                new_tex = None
+            self.use_shader = new_tex is not None
+        if new_tex is None:
+            new_tex = self.render_shader_cpu(uniforms)
         # alpha blends the shader onto the frame
         ImageUtils.blend(frame_info.render_buffer, new_tex, position=Vector(0,0), centered=False, blend_mode="normal")
     
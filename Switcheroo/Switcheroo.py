@@ -6,6 +6,7 @@ class Switcheroo(FX):
     def setup(self):
         self.requires_mask = True # if your fx requires segmentation of objects
         self.requires_inpainting = True # if your fx requires inpainting of objects
+        self.frame_independent = True
 
     def get_custom_inspector(self):
         return [
@@ -0,0 +1,160 @@
+"""Offline export for the fx plugins.
+
+Renders a clip of synthetic footage through one plugin, like run.py, but for the whole clip and with the
+frames handed back in order. Plugins that declare frame_independent fan their frames out over a process
+pool: every worker builds its own fx once, renders straight into a slot of a shared memory ring and only
+the frame index travels back, the parent reads the slots in frame order.
+
+Stateful plugins whose state fades out (MoTrail) say how many frames that takes with
+get_warmup_frames(). Their clip is cut into chunks, each rendered by a fresh fx that starts that many
+frames before the chunk, so by its first frame the state is the same as in a serial render. A plugin only
+offers a warm-up when the match is exact, MoTrail for instance only when every trail is stamped, and
+returns None otherwise, which exports serially. It is asked after rendering one frame.
+
+    python bench/export.py Pixelate --frames 240 --workers 8
+    python bench/export.py Eraser --res 4k --out eraser.mp4
+    python bench/export.py MoTrail --frames 600 --workers 8 --chunk-frames 100
+"""
+import argparse
+import os
+import sys
+import time
+from multiprocessing import get_context, shared_memory
+
+import cv2
+import numpy as np
+
+from run import PRESETS, RESOLUTIONS, create_fx, discover_plugins, load_fx_class, render
+
+# state of a pool worker, set once by init_worker
+worker = {}
+
+
+def find_plugin(name):
+    for plugin_name, plugin_dir, meta in discover_plugins():
+        fx_class = load_fx_class(plugin_dir, meta)
+        if name in (plugin_name, fx_class.__name__):
+            return plugin_dir, meta, fx_class
+    raise SystemExit(f"no plugin named {name}")
+
+
+def get_warmup_frames(fx):
+    """Frames a chunk has to start early to match a serial render: 0 if the fx is frame independent, None if only a serial render will do."""
+    # the host's base class has no such flag, only a plugin that sets it is rendered out of order
+    if getattr(fx, "frame_independent", False):
+        return 0
+    get_warmup_frames = getattr(fx, "get_warmup_frames", None)
+    return get_warmup_frames() if get_warmup_frames is not None else None
+
+
+def init_worker(plugin_dir, meta, width, height, num_sprites, shm_name, slots):
+    fx_class = load_fx_class(plugin_dir, meta)
+    worker["create_fx"] = lambda: create_fx(fx_class, width, height, num_sprites, PRESETS.get(fx_class.__name__, {}))
+    worker["fx"], worker["api"] = worker["create_fx"]()
+    worker["shm"] = shared_memory.SharedMemory(name=shm_name)
+    worker["ring"] = np.ndarray((slots, height, width, 3), dtype=np.uint8, buffer=worker["shm"].buf)
+
+
+def render_chunk(start, end, warmup, slot):
+    """Renders frames start - warmup to end and writes start to end into the ring from slot on."""
+    fx, api = worker["fx"], worker["api"]
+    if warmup:
+        # stateful fx start every chunk from scratch and render the warm up frames to rebuild their state
+        fx, api = worker["create_fx"]()
+    ring = worker["ring"]
+    for index in range(max(start - warmup, 0), end):
+        output, _ = render(fx, api, index)
+        if index >= start:
+            ring[slot + index - start] = output[..., :3]
+    return start
+
+
+def export_serial(fx_class, width, height, num_sprites, frames, on_frame):
+    fx, api = create_fx(fx_class, width, height, num_sprites, PRESETS.get(fx_class.__name__, {}))
+    for index in range(frames):
+        output, _ = render(fx, api, index)
+        on_frame(index, output[..., :3])
+
+
+def export_parallel(plugin_dir, meta, width, height, num_sprites, frames, on_frame, workers, chunk_frames=1, warmup=0):
+    """
+    Renders chunks of chunk_frames frames on a pool of workers, on_frame(index, frame) is called in frame order
+    with a view into the ring. Each chunk of a stateful fx starts warmup frames early.
+    """
+    # two chunks per worker are in flight, the ring holds all of their frames
+    in_flight = workers * 2
+    slots = in_flight * chunk_frames
+    frame_bytes = width * height * 3
+    shm = shared_memory.SharedMemory(create=True, size=slots * frame_bytes)
+    try:
+        ring = np.ndarray((slots, height, width, 3), dtype=np.uint8, buffer=shm.buf)
+        init_args = (plugin_dir, meta, width, height, num_sprites, shm.name, slots)
+        with get_context("spawn").Pool(workers, initializer=init_worker, initargs=init_args) as pool:
+            # a chunk is only handed out once the chunk that last used its part of the ring has been consumed
+            starts = list(range(0, frames, chunk_frames))
+            pending = {}
+            next_submit = 0
+            for chunk, start in enumerate(starts):
+                while next_submit < len(starts) and next_submit < chunk + in_flight:
+                    submit_start = starts[next_submit]
+                    submit_end = min(submit_start + chunk_frames, frames)
+                    slot = (next_submit % in_flight) * chunk_frames
+                    pending[next_submit] = pool.apply_async(render_chunk, (submit_start, submit_end, warmup, slot))
+                    next_submit += 1
+                pending.pop(chunk).get()
+                slot = (chunk % in_flight) * chunk_frames
+                for index in range(start, min(start + chunk_frames, frames)):
+                    on_frame(index, ring[slot + index - start])
+        del ring
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("fx", help="plugin directory or class name")
+    parser.add_argument("--res", default="1080p", choices=list(RESOLUTIONS))
+    parser.add_argument("--sprites", type=int, default=4)
+    parser.add_argument("--frames", type=int, default=120)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--serial", action="store_true", help="render on this process only")
+    parser.add_argument("--chunk-frames", type=int, help="frames per task, defaults to 1 for frame independent fx and 4x the warm up for stateful ones")
+    parser.add_argument("--out", help="write the clip to this video file")
+    args = parser.parse_args(argv)
+
+    plugin_dir, meta, fx_class = find_plugin(args.fx)
+    width, height = RESOLUTIONS[args.res]
+
+    writer = None
+    if args.out:
+        writer = cv2.VideoWriter(args.out, cv2.VideoWriter_fourcc(*"mp4v"), 30, (width, height))
+
+    def on_frame(index, frame):
+        if writer is not None:
+            writer.write(np.ascontiguousarray(frame))
+
+    fx, api = create_fx(fx_class, width, height, args.sprites, PRESETS.get(fx_class.__name__, {}))
+    # one frame in, so fx that check a fast path against the host on their first render have done so
+    render(fx, api, 0)
+    warmup = get_warmup_frames(fx)
+    parallel = warmup is not None and not args.serial and args.workers > 1
+    # the warm up is paid once per chunk, so stateful fx get long chunks
+    chunk_frames = (args.chunk_frames or max(warmup * 4, 1)) if parallel else None
+
+    start = time.perf_counter()
+    if parallel:
+        export_parallel(plugin_dir, meta, width, height, args.sprites, args.frames, on_frame, args.workers, chunk_frames, warmup)
+    else:
+        export_serial(fx_class, width, height, args.sprites, args.frames, on_frame)
+    elapsed = time.perf_counter() - start
+
+    if writer is not None:
+        writer.release()
+    mode = f"{args.workers} workers, {chunk_frames} frame chunks, {warmup} warm up frames" if parallel else "serial"
+    print(f"{fx_class.__name__} {args.res} {args.frames} frames, {mode}: {elapsed:.2f}s, {args.frames / elapsed:.1f} fps")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
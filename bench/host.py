@@ -0,0 +1,302 @@
+import copy
+
+import cv2
+import numpy as np
+from fx_api.utils.image import ImageUtils
+from fx_api.utils.vector import Vector
+
+
+class Keyframe:
+    def __init__(self, frame_index, transform=None, meta=None):
+        self.frame_index = frame_index
+        self.transform = transform if transform is not None else {}
+        self.meta = meta if meta is not None else {}
+
+
+class ObjectInfo:
+    """A synthetic tracked object: an ellipse that drifts around a home position."""
+
+    def __init__(self, id, center, axes, drift, phase):
+        self.id = id
+        self.center = center
+        self.axes = axes
+        self.drift = drift
+        self.phase = phase
+        w, h = axes[0] * 2 + 1, axes[1] * 2 + 1
+        patch = np.zeros((h, w), dtype=np.uint8)
+        cv2.ellipse(patch, (axes[0], axes[1]), axes, 0, 0, 360, 1, thickness=cv2.FILLED)
+        self.patch = patch.astype(bool)
+
+    def mask_at(self, index, width, height):
+        cx = int(self.center[0] + self.drift * np.sin(index * 0.15 + self.phase))
+        cy = int(self.center[1] + self.drift * 0.5 * np.cos(index * 0.1 + self.phase))
+        ph, pw = self.patch.shape
+        x1, y1 = cx - pw // 2, cy - ph // 2
+        cx1, cy1 = max(x1, 0), max(y1, 0)
+        cx2, cy2 = min(x1 + pw, width), min(y1 + ph, height)
+
+        mask = np.zeros((height, width), dtype=bool)
+        mask[cy1:cy2, cx1:cx2] = self.patch[cy1 - y1:cy2 - y1, cx1 - x1:cx2 - x1]
+        return mask, [cx1, cy1, cx2, cy2]
+
+
+class Sprite:
+    def __init__(self, api, object_info=None, type="cutout", parent=None):
+        self.api = api
+        self.object_info = object_info
+        self.type = type
+        self.parent = parent
+        self.children = []
+        self.mask = None
+        self.bbox = [0, 0, 0, 0]
+        self.frame_index = 0
+        self.blend_mode = "Normal"
+        self.meta = {}
+        self.anchor_point = Vector(0.0, 0.0)
+        self.keyframes = [Keyframe(0, {"translation": Vector(0, 0), "scale": Vector(1.0, 1.0)})]
+
+    @property
+    def start_keyframe(self):
+        return self.keyframes[0]
+
+    def _keyframe_at(self, frame_index):
+        if frame_index is None:
+            frame_index = self.frame_index
+        for keyframe in self.keyframes:
+            if keyframe.frame_index == frame_index:
+                return keyframe
+        keyframe = Keyframe(frame_index)
+        self.keyframes.append(keyframe)
+        self.keyframes.sort(key=lambda k: k.frame_index)
+        return keyframe
+
+    def _transform_value(self, key, default):
+        value = default
+        for keyframe in self.keyframes:
+            if keyframe.frame_index > self.frame_index:
+                break
+            value = keyframe.transform.get(key, value)
+        return value
+
+    @property
+    def local_transform(self):
+        return {
+            "translation": self._transform_value("translation", Vector(0, 0)),
+            "scale": self._transform_value("scale", Vector(1.0, 1.0)),
+        }
+
+    def get_meta(self, key, default=None):
+        value = self.meta.get(key, default)
+        for keyframe in self.keyframes:
+            if keyframe.frame_index > self.frame_index:
+                break
+            value = keyframe.meta.get(key, value)
+        return value
+
+    def set_meta(self, key, value, frame_index=None):
+        self._keyframe_at(frame_index).meta[key] = value
+
+    def set_parent(self, parent):
+        self.parent = parent
+        parent.children.append(self)
+
+    def set_scale(self, scale, frame_index=None, local=False):
+        self._keyframe_at(frame_index).transform["scale"] = Vector(*scale)
+
+    def get_scale(self, local=False):
+        return self._transform_value("scale", Vector(1.0, 1.0))
+
+    def set_position(self, position, frame_index=None):
+        center = self.bbox_center()
+        self._keyframe_at(frame_index).transform["translation"] = Vector(*position) - center
+
+    def set_anchor_point_normalized(self, point):
+        self.anchor_point = Vector(*point)
+
+    def is_transformed(self):
+        transform = self.local_transform
+        return transform["translation"] != (0, 0) or transform["scale"] != (1.0, 1.0)
+
+    def bbox_center(self):
+        source = self.parent if self.object_info is None and self.parent is not None else self
+        x1, y1, x2, y2 = source.bbox
+        return Vector((x1 + x2) / 2, (y1 + y2) / 2)
+
+    def normalized_point_to_global(self, point):
+        x1, y1, x2, y2 = self.bbox
+        half = Vector((x2 - x1) / 2, (y2 - y1) / 2) * self.get_scale()
+        return self.bbox_center() + self.local_transform["translation"] + half * point
+
+    def local_to_global(self, point):
+        return self.normalized_point_to_global(point)
+
+    def get_mask_image(self):
+        if self.mask is None:
+            return None
+        return cv2.cvtColor((self.mask > 0).astype(np.uint8) * 255, cv2.COLOR_GRAY2BGR)
+
+    def _text_size(self):
+        # (width, height) of a text sprite's bitmap, its text with a 4 pixel border
+        text = self.get_meta("text", "Caption")
+        (tw, th), baseline = cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, self.get_meta("font_size", 2.0), 3)
+        return tw + 8, th + baseline + 8
+
+    def _content(self, frame_info):
+        if self.type == "cutout":
+            if self.mask is None:
+                return None
+            x1, y1, x2, y2 = [int(v) for v in self.bbox]
+            if x2 <= x1 or y2 <= y1:
+                return None
+            alpha = (self.mask[y1:y2, x1:x2] > 0).astype(np.uint8) * 255
+            return np.dstack((frame_info.frame[y1:y2, x1:x2], alpha))
+        if self.type == "text":
+            text = self.get_meta("text", "Caption")
+            size = self.get_meta("font_size", 2.0)
+            (tw, th), baseline = cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, size, 3)
+            canvas = np.zeros(self._text_size()[::-1] + (4,), dtype=np.uint8)
+            cv2.putText(canvas, text, (4, th + 4), cv2.FONT_HERSHEY_SIMPLEX, size, (255, 255, 255, 255), 3, cv2.LINE_AA)
+            return canvas
+        # image / video replacement media, synthesised at the parent's size
+        x1, y1, x2, y2 = self.parent.bbox if self.parent is not None else self.bbox
+        w, h = max(int(x2 - x1), 1), max(int(y2 - y1), 1)
+        media = np.full((h, w, 4), 255, dtype=np.uint8)
+        media[..., :3] = (self.frame_index * 7) % 255
+        return media
+
+    def blit_sprite(self, frame_info, image, is_transformed=False):
+        if is_transformed:
+            sx, sy = self.get_scale()
+            if (sx, sy) != (1.0, 1.0):
+                h, w = image.shape[:2]
+                size = (max(int(w * sx), 1), max(int(h * sy), 1))
+                image = cv2.resize(image, size, interpolation=cv2.INTER_LINEAR)
+        position = self.bbox_center() + self.local_transform["translation"]
+        target = frame_info.override_buffer if frame_info.override_buffer is not None else frame_info.render_buffer
+        ImageUtils.blend(target, image, position, centered=True, blend_mode=self.blend_mode)
+
+    def render(self, frame_info):
+        content = self._content(frame_info)
+        if content is None:
+            return
+        self.blit_sprite(frame_info, content, is_transformed=self.is_transformed())
+
+
+class SpriteManager:
+    def __init__(self, api):
+        self.api = api
+        self.sprites = []
+        self.selected_sprite = None
+
+    def add_sprite(self, object_info):
+        # the parent is the untouched object, the sprite is what the user drags around
+        root = Sprite(self.api, object_info)
+        sprite = Sprite(self.api, object_info, parent=root)
+        self.sprites.append(sprite)
+        self.selected_sprite = sprite
+        return sprite
+
+    def add_sprite_of_type(self, type, parent=None):
+        if parent is None:
+            parent = self.selected_sprite
+        sprite = Sprite(self.api, None, type=type, parent=parent)
+        if parent is not None:
+            parent.children.append(sprite)
+        self.sprites.append(sprite)
+        self.selected_sprite = sprite
+        return sprite
+
+    def clone_sprite(self):
+        source = self.selected_sprite
+        if source is None:
+            return None
+        clone = copy.copy(source)
+        clone.meta = dict(source.meta)
+        clone.children = []
+        clone.keyframes = copy.deepcopy(source.keyframes)
+        self.sprites.append(clone)
+        self.selected_sprite = clone
+        return clone
+
+    def delete_sprite(self, sprite):
+        if sprite in self.sprites:
+            self.sprites.remove(sprite)
+        if self.selected_sprite is sprite:
+            self.selected_sprite = self.sprites[-1] if self.sprites else None
+
+
+class API:
+    """Headless stand-in for the host api: synthetic footage, masks and inpainting plus a CPU render_shader."""
+
+    def __init__(self, width, height, num_objects, seed=0, gl=True, shader_viewport="frame"):
+        self.width = width
+        self.height = height
+        self.gl = gl
+        self.shader_viewport = shader_viewport # "frame" renders every shader at frame size, "input" at the size of its first texture
+        self.fragment_shader = None
+        self.sprite_manager = SpriteManager(self)
+
+        rng = np.random.default_rng(seed)
+        gradient = np.linspace(0, 255, width, dtype=np.float32)[None, :, None]
+        noise = rng.integers(0, 64, (height, width, 3), dtype=np.uint8)
+        self.frame = (gradient * np.array([0.4, 0.7, 1.0], dtype=np.float32) * 0.75).astype(np.uint8) + noise
+        self.inpainted = cv2.blur(self.frame, (31, 31))
+
+        cols = int(np.ceil(np.sqrt(num_objects)))
+        rows = int(np.ceil(num_objects / cols))
+        cell_w, cell_h = width / cols, height / rows
+        axes = (max(int(cell_w * 0.2), 4), max(int(cell_h * 0.3), 4))
+        self.objects = []
+        for i in range(num_objects):
+            center = (int((i % cols + 0.5) * cell_w), int((i // cols + 0.5) * cell_h))
+            self.objects.append(ObjectInfo(i, center, axes, drift=cell_w * 0.15, phase=i * 0.7))
+
+    def get_resolution(self):
+        return (self.width, self.height)
+
+    def update(self, index):
+        """Advances every sprite to the given frame, like the host does before calling render_frame."""
+        for sprite in self.sprite_manager.sprites:
+            for node in (sprite, sprite.parent):
+                if node is None:
+                    continue
+                node.frame_index = index
+                if node.object_info is not None:
+                    node.mask, node.bbox = node.object_info.mask_at(index, self.width, self.height)
+            if sprite.type == "text":
+                # a text sprite's box is its bitmap, centered where it is placed
+                w, h = sprite._text_size()
+                cx, cy = sprite.bbox_center()
+                sprite.bbox = [cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2]
+
+    def get_mask_image(self, frame_index, object_id):
+        for object_info in self.objects:
+            if object_info.id == object_id:
+                mask, _ = object_info.mask_at(frame_index, self.width, self.height)
+                return cv2.cvtColor(mask.astype(np.uint8) * 255, cv2.COLOR_GRAY2BGR)
+        return None
+
+    def get_inpainting(self, frame_info):
+        return self.inpainted.copy()
+
+    def set_fragment_shader(self, source):
+        self.fragment_shader = source
+
+    def render_shader(self, uniforms):
+        if not self.gl:
+            # a headless worker without a gl context, the shader compiles nowhere
+            raise RuntimeError("no gl context")
+        # no GL here: copy every texture in and a frame back out so upload/readback cost is represented.
+        # The viewport is the whole frame, the first texture stretched over it, or with shader_viewport "input" the size of that texture.
+        textures = [np.ascontiguousarray(v).copy() for v in uniforms.values() if isinstance(v, np.ndarray)]
+        if not textures:
+            return np.zeros((self.height, self.width, 4), dtype=np.uint8)
+        src = textures[0]
+        if self.shader_viewport == "frame" and src.shape[:2] != (self.height, self.width):
+            src = cv2.resize(src, (self.width, self.height), interpolation=cv2.INTER_LINEAR)
+        if src.ndim == 2:
+            src = src[..., None]
+        out = np.empty(src.shape[:2] + (4,), dtype=np.uint8)
+        out[..., :3] = src[..., :3] if src.shape[2] >= 3 else src[..., :1]
+        out[..., 3] = src[..., 3] if src.shape[2] == 4 else 255
+        return out
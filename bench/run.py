@@ -0,0 +1,226 @@
+"""Offline benchmark for the fx plugins.
+
+Every plugin is loaded through its meta.json against the headless fx_api stand-in in bench/stubs,
+fed synthetic footage and masks, and timed on render_background + render_frame.
+
+    python bench/run.py
+    python bench/run.py --fx Pixelate MoTrail --res 4k --sprites 1 16 --frames 60
+    python bench/run.py --save baseline.json
+    python bench/run.py --fx Edgy Inflate Playground --no-gl
+    python bench/run.py --fx Inflate --shader-viewport input
+    python bench/run.py --compare baseline.json --threshold 0.15
+"""
+import argparse
+import importlib.util
+import inspect
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, os.path.join(BENCH_DIR, "stubs"))
+sys.path.insert(0, BENCH_DIR)
+
+from fx_api.fx import FX, FrameInfo  # noqa: E402
+from fx_api.utils.vector import Vector  # noqa: E402
+from host import API  # noqa: E402
+
+RESOLUTIONS = {
+    "720p": (1280, 720),
+    "1080p": (1920, 1080),
+    "4k": (3840, 2160),
+}
+
+# sprite meta / transforms that make each effect do real work instead of its no-op default
+PRESETS = {
+    "AntMan": {"scale": (0.5, 0.5), "scale_frame": 1},
+    "CopyPasta": {"scale": (1.2, 1.2), "clones": 3},
+    "GoGoGadget": {"offset": (0.0, -0.6)},
+    "Inflate": {"meta": {"inflate_size": 40}},
+    "MaskingTape": {"meta": {"foreground_color": (40, 200, 240)}, "fx_meta": {"background_color": (20, 20, 20)}},
+    "MoCaption": {"captions": True},
+    "MoTrail": {"meta": {"trail_color": (255, 80, 0)}},
+    "Pixelate": {"meta": {"pixel_color": (30, 60, 220)}},
+    "Switcheroo": {"replace": "video"},
+}
+
+
+def discover_plugins(root=ROOT_DIR):
+    plugins = []
+    for name in sorted(os.listdir(root)):
+        meta_path = os.path.join(root, name, "meta.json")
+        if not os.path.isfile(meta_path):
+            continue
+        with open(meta_path) as f:
+            meta = json.load(f)
+        plugins.append((name, os.path.join(root, name), meta))
+    return plugins
+
+
+def load_fx_class(plugin_dir, meta):
+    path = os.path.join(plugin_dir, meta["fx"])
+    module_name = "fx_bench_" + os.path.splitext(meta["fx"])[0]
+    spec = importlib.util.spec_from_file_location(module_name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    for _, cls in inspect.getmembers(module, inspect.isclass):
+        if issubclass(cls, FX) and cls is not FX and cls.__module__ == module_name:
+            return cls
+    raise RuntimeError(f"no FX subclass found in {path}")
+
+
+def apply_inspector_defaults(fx):
+    """Seeds sprite and fx meta from the inspector defaults, as the host does when sprites are created."""
+    for item in fx.get_custom_inspector():
+        if "default" not in item:
+            continue
+        if "sprite_meta" in item:
+            for sprite in fx.sprite_manager.sprites:
+                sprite.meta.setdefault(item["sprite_meta"], item["default"])
+        elif "meta" in item:
+            fx.meta.setdefault(item["meta"], item["default"])
+
+
+def apply_preset(fx, preset):
+    manager = fx.sprite_manager
+    for sprite in list(manager.sprites):
+        manager.selected_sprite = sprite
+        if preset.get("captions"):
+            fx.add_caption()
+        if preset.get("replace"):
+            fx.replace_with(preset["replace"])
+        for _ in range(preset.get("clones", 0)):
+            manager.selected_sprite = sprite
+            manager.clone_sprite()
+    for sprite in manager.sprites:
+        sprite.meta.update(preset.get("meta", {}))
+        if "scale" in preset:
+            sprite.set_scale(Vector(*preset["scale"]), frame_index=preset.get("scale_frame", 0))
+        if "offset" in preset and sprite.object_info is not None:
+            x1, y1, x2, y2 = sprite.bbox
+            offset = Vector(*preset["offset"]) * Vector(x2 - x1, y2 - y1)
+            sprite.keyframes[0].transform["translation"] = offset
+    fx.meta.update(preset.get("fx_meta", {}))
+
+
+def create_fx(fx_class, width, height, num_sprites, preset, gl=True, shader_viewport="frame"):
+    api = API(width, height, num_sprites, gl=gl, shader_viewport=shader_viewport)
+    fx = fx_class(api)
+    fx.on_ready()
+    api.update(0)
+    apply_inspector_defaults(fx)
+    apply_preset(fx, preset)
+    api.update(0)
+    return fx, api
+
+
+def render(fx, api, index):
+    """Renders one frame and returns (output, seconds spent inside the plugin)."""
+    api.update(index)
+    frame_info = FrameInfo(index, api.frame.copy())
+    start = time.perf_counter()
+    fx.render_background(frame_info)
+    result = fx.render_frame(frame_info)
+    elapsed = time.perf_counter() - start
+    return (result if result is not None else frame_info.render_buffer), elapsed
+
+
+def bench_case(fx_class, width, height, num_sprites, frames, warmup, preset, gl=True, shader_viewport="frame"):
+    fx, api = create_fx(fx_class, width, height, num_sprites, preset, gl, shader_viewport)
+    times = []
+    for index in range(frames):
+        _, elapsed = render(fx, api, index)
+        if index >= warmup:
+            times.append(elapsed)
+
+    # second, shorter pass under tracemalloc so it does not skew the timings
+    fx, api = create_fx(fx_class, width, height, num_sprites, preset, gl, shader_viewport)
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    per_frame = []
+    peak = 0
+    for index in range(min(frames, warmup + 5)):
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        render(fx, api, index)
+        current, frame_peak = tracemalloc.get_traced_memory()
+        per_frame.append(frame_peak - before)
+        peak = max(peak, frame_peak - baseline)
+    retained = current - baseline
+    tracemalloc.stop()
+
+    times_ms = np.array(times) * 1000
+    mib = 1024 * 1024
+    return {
+        "p50_ms": float(np.percentile(times_ms, 50)),
+        "p90_ms": float(np.percentile(times_ms, 90)),
+        "p99_ms": float(np.percentile(times_ms, 99)),
+        "alloc_mib": float(np.mean(per_frame)) / mib,
+        "peak_mib": peak / mib,
+        "retained_mib": retained / mib,
+    }
+
+
+def compare(results, baseline, threshold):
+    regressions = []
+    for key, result in results.items():
+        old = baseline.get(key)
+        if old is None:
+            continue
+        for metric in ("p50_ms", "peak_mib"):
+            if old[metric] > 0 and result[metric] > old[metric] * (1 + threshold):
+                regressions.append(f"{key} {metric}: {old[metric]:.2f} -> {result[metric]:.2f}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fx", nargs="*", help="plugin directories or class names to run (default: all)")
+    parser.add_argument("--res", nargs="*", default=list(RESOLUTIONS), choices=list(RESOLUTIONS))
+    parser.add_argument("--sprites", nargs="*", type=int, default=[1, 4, 16])
+    parser.add_argument("--frames", type=int, default=30)
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--save", help="write results as json")
+    parser.add_argument("--compare", help="baseline json to check for regressions")
+    parser.add_argument("--no-gl", action="store_true", help="run as a headless host without a gl context, shader fx use their cpu kernels")
+    parser.add_argument("--shader-viewport", default="frame", choices=["frame", "input"],
+                        help="render shaders at frame size, or at the size of their first texture")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed relative slowdown before failing")
+    args = parser.parse_args(argv)
+
+    results = {}
+    print(f"{'fx':<14}{'res':>7}{'sprites':>9}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'alloc MiB':>11}{'peak MiB':>10}")
+    for name, plugin_dir, meta in discover_plugins():
+        fx_class = load_fx_class(plugin_dir, meta)
+        if args.fx and name not in args.fx and fx_class.__name__ not in args.fx:
+            continue
+        preset = PRESETS.get(fx_class.__name__, {})
+        for res in args.res:
+            width, height = RESOLUTIONS[res]
+            for num_sprites in args.sprites:
+                result = bench_case(fx_class, width, height, num_sprites, args.frames, args.warmup, preset, not args.no_gl, args.shader_viewport)
+                results[f"{fx_class.__name__}/{res}/{num_sprites}"] = result
+                print(f"{fx_class.__name__:<14}{res:>7}{num_sprites:>9}{result['p50_ms']:>10.2f}{result['p90_ms']:>10.2f}"
+                      f"{result['p99_ms']:>10.2f}{result['alloc_mib']:>11.1f}{result['peak_mib']:>10.1f}", flush=True)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for line in regressions:
+            print("REGRESSION", line)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
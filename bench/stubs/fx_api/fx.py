@@ -0,0 +1,63 @@
+import inspect
+import os
+
+import cv2
+
+
+class FrameInfo:
+    def __init__(self, index, frame, render_buffer=None):
+        self.index = index
+        self.frame = frame
+        self.render_buffer = render_buffer
+        self.override_buffer = None
+
+
+class FX:
+    """Headless stand-in for the host's FX base class, just enough to drive render_frame offline."""
+
+    def __init__(self, api):
+        self.api = api
+        self.sprite_manager = api.sprite_manager
+        self.meta = {}
+        self.is_ready = False
+        self.requires_mask = False
+        self.requires_inpainting = False
+        self.requires_pose = False
+        self.requires_sprites = False
+        self.frame_independent = False
+        self.setup()
+
+    def setup(self):
+        pass
+
+    # adds a default cutout sprite for every tracked object
+    def on_ready(self):
+        for object_info in self.api.objects:
+            self.sprite_manager.add_sprite(object_info)
+        self.is_ready = True
+
+    def get_meta(self, key, default=None):
+        return self.meta.get(key, default)
+
+    def set_meta(self, key, value):
+        self.meta[key] = value
+
+    def current_sprite(self):
+        return self.sprite_manager.selected_sprite
+
+    def get_image_resource(self, name):
+        fx_dir = os.path.dirname(inspect.getfile(type(self)))
+        return cv2.imread(os.path.join(fx_dir, name), cv2.IMREAD_UNCHANGED)
+
+    def get_custom_inspector(self):
+        return []
+
+    def render_background(self, frame_info: FrameInfo):
+        if self.requires_inpainting:
+            frame_info.render_buffer = self.api.get_inpainting(frame_info)
+        else:
+            frame_info.render_buffer = frame_info.frame.copy()
+
+    def render_frame(self, frame_info: FrameInfo):
+        for sprite in self.sprite_manager.sprites:
+            sprite.render(frame_info)
@@ -0,0 +1,6 @@
+ANCHOR_ID = "anchor"
+
+
+class AnchorManager:
+    def __init__(self, *args, **kwargs):
+        self.anchors = {}
@@ -0,0 +1,60 @@
+import numpy as np
+from fx_api.utils.vector import Vector
+
+
+def _mix(mode, base, over):
+    if mode == "add":
+        return base + over
+    if mode == "subtract":
+        return base - over
+    if mode == "multiply":
+        return base * over / 255
+    if mode == "screen":
+        return 255 - (255 - base) * (255 - over) / 255
+    if mode == "darken":
+        return np.minimum(base, over)
+    if mode == "lighten":
+        return np.maximum(base, over)
+    if mode == "difference":
+        return np.abs(base - over)
+    return over
+
+
+class ImageUtils:
+    @staticmethod
+    def blend(base, overlay, position=Vector(0, 0), centered=False, blend_mode="normal"):
+        """Blends overlay onto base in place, clipped to the bounds of base. A 4th overlay channel is used as alpha."""
+        oh, ow = overlay.shape[:2]
+        x, y = int(position[0]), int(position[1])
+        if centered:
+            x -= ow // 2
+            y -= oh // 2
+        bh, bw = base.shape[:2]
+        x1, y1 = max(x, 0), max(y, 0)
+        x2, y2 = min(x + ow, bw), min(y + oh, bh)
+        if x1 >= x2 or y1 >= y2:
+            return base
+
+        dst = base[y1:y2, x1:x2]
+        src = overlay[y1 - y:y2 - y, x1 - x:x2 - x]
+        if src.ndim == 2:
+            src = src[..., None]
+
+        base_color = dst[..., :3].astype(np.float32)
+        over_color = src[..., :3].astype(np.float32)
+        if over_color.shape[2] == 1:
+            over_color = np.repeat(over_color, 3, axis=2)
+
+        mixed = _mix(blend_mode.lower(), base_color, over_color)
+        if src.shape[2] == 4:
+            alpha = src[..., 3:4].astype(np.float32) / 255
+            mixed = base_color + (mixed - base_color) * alpha
+        dst[..., :3] = np.clip(mixed, 0, 255).astype(base.dtype)
+
+        if dst.shape[2] == 4:
+            if src.shape[2] == 4:
+                over_alpha = src[..., 3].astype(np.float32)
+                dst[..., 3] = (over_alpha + dst[..., 3] * (1 - over_alpha / 255)).astype(np.uint8)
+            else:
+                dst[..., 3] = 255
+        return base
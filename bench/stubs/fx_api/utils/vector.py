@@ -0,0 +1,59 @@
+import math
+
+
+class Vector(tuple):
+    """2D vector stand-in. Subclasses tuple so it can be unpacked and passed straight to cv2 as a size."""
+
+    def __new__(cls, x=0, y=0):
+        return super().__new__(cls, (x, y))
+
+    def __getnewargs__(self):
+        # copy and deepcopy rebuild it from x, y rather than from the tuple
+        return tuple(self)
+
+    @property
+    def x(self):
+        return self[0]
+
+    @property
+    def y(self):
+        return self[1]
+
+    @staticmethod
+    def _pair(other):
+        if isinstance(other, (tuple, list)):
+            return other[0], other[1]
+        return other, other
+
+    def __add__(self, other):
+        ox, oy = self._pair(other)
+        return Vector(self[0] + ox, self[1] + oy)
+
+    __radd__ = __add__
+
+    def __sub__(self, other):
+        ox, oy = self._pair(other)
+        return Vector(self[0] - ox, self[1] - oy)
+
+    def __rsub__(self, other):
+        ox, oy = self._pair(other)
+        return Vector(ox - self[0], oy - self[1])
+
+    def __mul__(self, other):
+        ox, oy = self._pair(other)
+        return Vector(self[0] * ox, self[1] * oy)
+
+    __rmul__ = __mul__
+
+    def __truediv__(self, other):
+        ox, oy = self._pair(other)
+        return Vector(self[0] / ox, self[1] / oy)
+
+    def __neg__(self):
+        return Vector(-self[0], -self[1])
+
+    def round(self):
+        return Vector(int(round(self[0])), int(round(self[1])))
+
+    def length(self):
+        return math.hypot(self[0], self[1])
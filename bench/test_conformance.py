@@ -0,0 +1,239 @@
+"""Plugin fast paths against what they stand in for, on the bench's synthetic footage.
+
+CPU kernels of the shader fx against numpy ports of their GLSL, cutout bypasses and MoCaption's
+captured captions against the host's own sprite.render.
+
+    python -m pytest bench/test_conformance.py
+"""
+import os
+import sys
+
+import cv2
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from run import PRESETS, create_fx, discover_plugins, load_fx_class, render  # noqa: E402
+from host import Sprite  # noqa: E402
+from fx_api.fx import FrameInfo  # noqa: E402
+from fx_api.utils.vector import Vector  # noqa: E402
+
+PLUGINS = {name: (plugin_dir, meta) for name, plugin_dir, meta in discover_plugins()}
+
+
+def make_fx(name, width=640, height=360, num_sprites=4, preset=None, gl=False, shader_viewport="frame"):
+    fx_class = load_fx_class(*PLUGINS[name])
+    return create_fx(fx_class, width, height, num_sprites, preset or {}, gl=gl, shader_viewport=shader_viewport)
+
+
+def glow_shader(pack, pack_channels, uniforms):
+    # the glow shader in float64: up to 4 glows composited with over() and un-premultiplied, in bgra order
+    acc = np.zeros(pack.shape[:2] + (4,))
+    for i, channel in enumerate(pack_channels):
+        blurred = pack[..., channel, None] / 255
+        color = np.array(uniforms[f"u_glow_color{i}"]) / 255
+        bloom = np.clip(color / (1.1 - blurred) * blurred * uniforms[f"u_glow_strength{i}"] * 0.1, 0, 1)
+        acc[..., :3] = acc[..., :3] * (1 - blurred) + bloom * blurred
+        acc[..., 3:] = acc[..., 3:] * (1 - blurred) + blurred
+    alpha = acc[..., 3:]
+    color = np.where(alpha > 0, acc[..., :3] / np.where(alpha > 0, alpha, 1), 0)
+    return np.rint(np.dstack((color, alpha)) * 255).astype(int)
+
+
+def inflate_shader(frame_crop, mask_crop, center, bbox_size, strength, frame_size):
+    # the inflate shader line by line: fragCoord is the pixel center in roi uv, every distance is in frame uv
+    h, w = mask_crop.shape
+    width, height = frame_size
+    uv_x = ((np.arange(w) + 0.5) / w)[None, :] * w / width
+    uv_y = ((np.arange(h) + 0.5) / h)[:, None] * h / height
+    pos_x, pos_y = center[0] / width, center[1] / height
+    radius = np.hypot(bbox_size[0] / width, bbox_size[1] / height) * 0.5
+    dx, dy = uv_x - pos_x, uv_y - pos_y
+    t = np.clip(np.hypot(dx, dy) / radius, 0, 1)
+    scale = 1 - strength + strength * (t * t * (3 - 2 * t))
+    # texture() with linear filtering and clamp to edge
+    map_x = ((pos_x + dx * scale) * width - 0.5).astype(np.float32)
+    map_y = ((pos_y + dy * scale) * height - 0.5).astype(np.float32)
+    source = cv2.cvtColor(frame_crop, cv2.COLOR_BGR2BGRA)
+    source[..., 3] = mask_crop
+    return cv2.remap(source, map_x, map_y, cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
+
+
+@pytest.mark.parametrize("strength", [5, 40, 100])
+@pytest.mark.parametrize("num_sprites", [1, 4])
+def test_inflate_remap_matches_shader(strength, num_sprites):
+    width, height = 1280, 720
+    fx, api = make_fx("Inflate", width, height, num_sprites, {"meta": {"inflate_size": strength}})
+    for index in range(4):
+        api.update(index)
+        for sprite in api.sprite_manager.sprites:
+            x1, y1, x2, y2 = sprite.bbox
+            center = Vector((x1 + x2) / 2, (y1 + y2) / 2)
+            size = Vector(x2 - x1, y2 - y1)
+            s = strength / 100
+            # the roi render_shader crops, the bbox grown by the inflation
+            half = size / 2
+            rx1, ry1 = (center - half - half * s).round()
+            rx2, ry2 = (center + half + half * s).round()
+            rx1, ry1, rx2, ry2 = max(rx1, 0), max(ry1, 0), min(rx2, width), min(ry2, height)
+            mask = cv2.compare(sprite.mask[ry1:ry2, rx1:rx2].view(np.uint8), 0, cv2.CMP_GT)
+            frame = api.frame[ry1:ry2, rx1:rx2]
+
+            expected = inflate_shader(frame, mask, center - Vector(rx1, ry1), size, s, (width, height)).astype(int)
+            actual = fx.warp_cpu(frame, mask, center, size, s, (rx1, ry1), (width, height)).astype(int)
+            diff = np.abs(expected - actual)
+            # the grids are shared by bbox sizes within warp_size_step, which moves the falloff by under a pixel
+            assert diff.mean() < 3
+            assert np.percentile(diff, 99) < 32
+
+
+def test_inflate_warp_cache_stays_within_its_byte_budget():
+    fx, api = make_fx("Inflate", 3840, 2160, 1, {"meta": {"inflate_size": 100}})
+    fx.warp_cache_bytes = 32 * 1024 * 1024
+    for step in range(8):
+        size = Vector(400 + 40 * step, 600 + 40 * step)
+        fx.get_warp_grid(Vector(1000.5, 1000.5), size, 1.0, (3840, 2160))
+        grids = list(fx.warp_cache.values())
+        used = sum(map1.nbytes + map2.nbytes for map1, map2, _ in grids)
+        assert used == fx.warp_cache_used
+        assert used <= fx.warp_cache_bytes or len(grids) == 1
+
+
+def test_inflate_renders_the_same_whatever_the_shader_viewport():
+    # a host that renders at frame size gets the whole frame, one that renders the texture's size only the roi
+    fx, api = make_fx("Inflate", 1280, 720, 4, PRESETS["Inflate"], gl=True, shader_viewport="frame")
+    roi_fx, roi_api = make_fx("Inflate", 1280, 720, 4, PRESETS["Inflate"], gl=True, shader_viewport="input")
+    for index in range(4):
+        frame, _ = render(fx, api, index)
+        roi_frame, _ = render(roi_fx, roi_api, index)
+        assert np.array_equal(frame, roi_frame)
+    assert fx.shader_full_frame and not roi_fx.shader_full_frame
+
+
+@pytest.mark.parametrize("active", [1, 2, 4])
+def test_edgy_cpu_matches_shader(active):
+    fx, api = make_fx("Edgy")
+    rng = np.random.default_rng(active)
+    pack = np.zeros((360, 640, 4), dtype=np.uint8)
+    for i in rng.choice(4, active, replace=False):
+        x, y = rng.integers(0, 400), rng.integers(0, 200)
+        noise = rng.integers(0, 256, (150, 230), dtype=np.uint8)
+        pack[y:y+150, x:x+230, fx.pack_channels[i]] = cv2.GaussianBlur(noise, (0, 0), 5)
+    uniforms = {"u_blurredMasks": pack}
+    for i in range(4):
+        uniforms[f"u_glow_strength{i}"] = float(rng.integers(0, 100))
+        uniforms[f"u_glow_color{i}"] = tuple(int(v) for v in rng.integers(0, 256, 3))
+
+    expected = glow_shader(pack, fx.pack_channels, uniforms)
+    actual = fx.render_shader_cpu(uniforms).astype(int)
+    assert np.abs(expected - actual).max() <= 1
+
+
+def test_playground_cpu_matches_shader():
+    fx, api = make_fx("Playground")
+    frame = api.frame
+    gray = np.rint(frame[..., 2] * 0.299 + frame[..., 1] * 0.587 + frame[..., 0] * 0.114)
+    actual = fx.render_shader_cpu({"texSampler": frame}).astype(int)
+    for channel in range(3):
+        assert np.abs(actual[..., channel] - gray).max() <= 1
+    assert (actual[..., 3] == 255).all()
+
+
+@pytest.mark.parametrize("name", ["Edgy", "Inflate", "Playground"])
+def test_fx_fall_back_to_cpu_without_gl(name, monkeypatch):
+    # a host that takes the shader but can not render it, and one that refuses it outright
+    fx, api = make_fx(name, preset={"meta": {"inflate_size": 40}}, gl=False)
+    if name == "Playground":
+        # Playground only shades when asked to
+        frame_info = FrameInfo(0, api.frame.copy())
+        fx.render_background(frame_info)
+        fx.render_shader(frame_info)
+    else:
+        render(fx, api, 0)
+    assert (fx.cpu_warp if name == "Inflate" else not fx.use_shader)
+
+    def refuse(source):
+        raise RuntimeError("no gl context")
+    monkeypatch.setattr(api, "set_fragment_shader", refuse)
+    fx = type(fx)(api)
+    assert (fx.cpu_warp if name == "Inflate" else not fx.use_shader)
+
+
+# the attribute each cutout bypass keeps its verdict in, on the sprite it checked
+BYPASS_VERDICTS = {
+    "AntMan": "cutout_verdict", "CopyPasta": "cutout_verdict", "MaskingTape": "stamp_verdict", "MoTrail": "stamp_verdict",
+}
+
+
+@pytest.mark.parametrize("feather", [False, True])
+@pytest.mark.parametrize("name", sorted(BYPASS_VERDICTS))
+def test_cutout_bypass_only_when_the_host_agrees(name, feather, monkeypatch):
+    # the bypasses cut sprites out with a hard edged mask, a host that feathers its cutouts has to keep rendering them
+    if feather:
+        content = Sprite._content
+
+        def feathered(sprite, frame_info):
+            image = content(sprite, frame_info)
+            if image is not None and sprite.type == "cutout":
+                image[..., 3] = cv2.GaussianBlur(image[..., 3], (5, 5), 0)
+            return image
+        monkeypatch.setattr(Sprite, "_content", feathered)
+
+    verdict = BYPASS_VERDICTS[name]
+    fx, api = make_fx(name, preset=PRESETS[name])
+    host_fx, host_api = make_fx(name, preset=PRESETS[name])
+    for index in range(4):
+        frame, _ = render(fx, api, index)
+        host_frame, _ = render(host_fx, host_api, index)
+        # the reference renders through the host on every frame, whatever its checks found
+        for sprite in host_api.sprite_manager.sprites:
+            if getattr(sprite, verdict, None) is not None:
+                setattr(sprite, verdict, (getattr(sprite, verdict)[0], False))
+        if feather:
+            assert np.array_equal(frame, host_frame)
+    checked = [getattr(sprite, verdict)[1] for sprite in api.sprite_manager.sprites if hasattr(sprite, verdict)]
+    assert checked and all(ok == (not feather) for ok in checked)
+
+
+@pytest.mark.parametrize("scale", [2.0, 1.37, 0.75, 0.5, 0.3, 0.1])
+def test_antman_scaled_cutouts_match_the_host(scale):
+    # scaled sprites land where the host puts them, below half size the pyramid only softens what the host would alias
+    preset = {"scale": (scale, scale), "scale_frame": 1}
+    fx, api = make_fx("AntMan", 1280, 720, 4, preset)
+    host_fx, host_api = make_fx("AntMan", 1280, 720, 4, preset)
+    host_fx.render_scaled = lambda frame_info, sprite: False
+    for index in range(5):
+        frame, _ = render(fx, api, index)
+        host_frame, _ = render(host_fx, host_api, index)
+        diff = np.abs(frame.astype(int) - host_frame)
+        if scale >= 0.5:
+            assert diff.max() <= 2
+        else:
+            assert diff.mean() < 0.5
+    assert all(sprite.cutout_verdict[1] for sprite in api.sprite_manager.sprites)
+
+
+
+@pytest.mark.parametrize("motion", ["static", "scaling", "off_frame"])
+def test_mocaption_caches_only_captions_it_can_capture_whole(motion):
+    # captions are captured once and then blended, animated or cut off captions are left to the host
+    fx, api = make_fx("MoCaption", 1280, 720, 4, PRESETS["MoCaption"])
+    host_fx, host_api = make_fx("MoCaption", 1280, 720, 4, PRESETS["MoCaption"])
+    host_fx.render_caption = lambda frame_info, sprite: sprite.render(frame_info)
+    for manager in (api.sprite_manager, host_api.sprite_manager):
+        for sprite in manager.sprites:
+            if sprite.type != "text":
+                continue
+            if motion == "scaling":
+                for index in range(8):
+                    sprite.set_scale(Vector(1 + index * 0.05, 1 + index * 0.05), frame_index=index)
+            elif motion == "off_frame":
+                sprite.keyframes[0].transform["translation"] += Vector(-2000, 0)
+    for index in range(8):
+        frame, _ = render(fx, api, index)
+        host_frame, _ = render(host_fx, host_api, index)
+        # the alpha recovered from the black and white captures is off by a level or two at anti-aliased edges
+        assert np.abs(frame.astype(int) - host_frame).max() <= (0 if motion == "off_frame" else 2)
+    # every caption has the same look, so one entry holds it, the first frame's for the scaling ones
+    assert len(fx.caption_cache) == (0 if motion == "off_frame" else 1)